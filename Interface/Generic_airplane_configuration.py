@@ -1,7 +1,7 @@
 from pandas._libs.lib import is_float, is_integer
 import streamlit as st
 import pandas as pd
-from gam_copy import GAM
+import app_cache
 from gam_utils import unit
 
 
@@ -220,7 +220,7 @@ def setup2():
         if design_mission[key] != "":
             c1 += 1
     if c1 == 5 and  c == 5:
-        gam = GAM()
+        gam = app_cache.new_gam()
         st.write("")
         table_rows = []
         this_dict = gam.design_airplane(power_system, design_mission)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Caching layer of the Streamlit application
+
+Data bases are read through the disk cache of data_analysis and kept in memory per version of their file, designs in
+the process wide design cache and domain maps per set of inputs. All of them are shared by the sessions and pages
+served by the process and bounded in size.
+
+:author: Conceptual Airplane Design & Operations (CADO team)
+         Aircraft & Systems, Air Transport Department, ENAC
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import streamlit as st
+
+from gam_copy import GAM
+from gam_utils import data_analysis as uda
+from gam_utils import database as udb
+from gam_utils.cache import shared_design_cache
+
+from draw_domains import find_indexes
+from doc_vs_techno_commuter_modify import init_commuter
+from doc_vs_techno_regional_modify import init_regional
+from doc_vs_techno_short_medium_modify import init_short
+from doc_vs_techno_long_range_modify import init_long
+
+
+# Domain map initializations, see domain_maps()
+DOMAIN_INITS = {f.__name__: f for f in [init_commuter, init_regional, init_short, init_long]}
+
+# Worker processes of the pool shared by all sessions for domain maps, set by the GAM_DOMAIN_WORKERS environment
+# variable, one per processor by default, maps are computed in the server process if it is 0 or 1
+DOMAIN_WORKERS = int(os.environ.get("GAM_DOMAIN_WORKERS", os.cpu_count() or 1))
+
+
+def read_excel(file):
+    """Raw sheet of an Excel file, served by the disk cache of data_analysis.read_excel()
+    Each call gets its own DataFrame, reading it from the disk cache is as fast as copying it from memory
+    """
+    return uda.read_excel(file)
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def cached_database(file, fingerprint):
+    return udb.AirplaneDatabase(uda.read_excel(file))
+
+
+def load_database(file):
+    """Indexed airplane data base of an Excel file, see database.AirplaneDatabase, the object is shared and read only
+    It is kept in memory per version of the file, see data_analysis.file_fingerprint(), the sheet is read once
+    through the disk cache of data_analysis.read_excel()
+    """
+    return cached_database(file, uda.file_fingerprint(file))
+
+
+@st.cache_resource(show_spinner=False)
+def design_cache():
+    """Design cache shared by all sessions, bounded LRU, see gam_utils.cache
+    """
+    return shared_design_cache
+
+
+def new_gam():
+    """New GAM instance whose designs go through the shared design cache
+    Instances are not shared as pages modify the model parameters
+    """
+    gam = GAM()
+    gam.enable_design_cache(cache=design_cache())
+    return gam
+
+
+@st.cache_resource(show_spinner=False)
+def process_pool():
+    """Process pool shared by all sessions, None if DOMAIN_WORKERS is 0 or 1
+    Workers are spawned as forking the multithreaded server process is not safe
+    """
+    if DOMAIN_WORKERS <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=DOMAIN_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def domain_setup(init_name, inputs):
+    """Power systems and criterion of the initialization named init_name, see DOMAIN_INITS, called with the tuple of inputs
+    Pages read them here rather than calling the initialization, which builds a GAM instance
+    """
+    gam, design_mission, power_system, dist_window, npax_window, criterion = DOMAIN_INITS[init_name](*inputs)
+    return power_system, criterion
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def domain_maps(init_names, inputs):
+    """Domain maps of find_indexes() for the initializations named in init_names, see DOMAIN_INITS,
+    called with the tuple of inputs, cells are evaluated by the shared process pool
+    """
+    jobs = [DOMAIN_INITS[name](*inputs) for name in init_names]
+    try:
+        return find_indexes(jobs, executor=process_pool())
+    except BrokenProcessPool:
+        process_pool.clear()    # A worker died, the next call starts a new pool
+        raise
@@ -12,6 +12,7 @@ import numpy as np
 from gam_utils.physical_data import PhysicalData
 from gam_utils import unit
 from gam_copy import GAM
+from gam_utils.cache import shared_design_cache
 
 from draw_domains import find_index, draw_domains
 import matplotlib.pyplot as plt
@@ -21,6 +22,7 @@ def init_regional(max_fuel_factor, stdm_factor, lod_factor,
                   emotor_price, fuel_cell_price, lh2_tank_price, battery_capacity_price,
                   battery_price, lh2_price, lch4_price, e_fuel_price):
     gam = GAM()
+    gam.enable_design_cache(cache=shared_design_cache)
 
     # Explore regional category
     #-----------------------------------------------------------------------------------------------------------------------
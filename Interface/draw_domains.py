@@ -7,6 +7,8 @@ Created on Thu Jan 20 20:20:20 2020
          Aircraft & Systems, Air Transport Department, ENAC
 """
 
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
 import pandas as pd
@@ -22,65 +24,315 @@ import matplotlib.patches as mpatches
 # Domain map
 #-----------------------------------------------------------------------------------------------------------------------
 
-def find_index(gam, design_mission, power_system, dist_window, npax_window, criterion):
+def cell_mission(design_mission, dist, npax):
+    """Design mission of a (range, npax) cell, range is in km
+    """
+    return {**design_mission, "range": unit.convert_from("km", dist), "npax": npax}
+
+
+def design_cells(gam, power_system, design_mission, cells):
+    """Sizing stage of the domain maps, retrieve the designs of a list of (range, npax) cells
+    The exception raised by a failing design is retrieved in place of its dictionary
+    This function is defined at module level so that it can be sent to worker processes
+    """
+    designs = []
+    for dist, npax in cells:
+        try:
+            designs.append(gam.design_airplane(power_system, cell_mission(design_mission, dist, npax)))
+        except Exception as error:
+            designs.append(error)
+    return designs
+
+
+def cost_cells(gam, designs, criterion):
+    """Cost stage of the domain maps, evaluate the criterion over a list of designs, np.inf is retrieved where they fail
+    """
+    values = []
+    for ac_dict in designs:
+        try:
+            if isinstance(ac_dict, Exception):
+                raise ac_dict
+            cost_dict = gam.operating_cost(ac_dict, traffic_zone="west_bound")
+            all_in_one = {**ac_dict, **cost_dict}
+            values.append(all_in_one[criterion])
+        except:
+            values.append(np.inf)
+    return values
+
+
+def eval_cells(gam, power_system, design_mission, criterion, cells):
+    """Evaluate the criterion over a list of (range, npax) cells, np.inf is retrieved where the design fails
+    """
+    return cost_cells(gam, design_cells(gam, power_system, design_mission, cells), criterion)
+
+
+def cached_cells(gam, power_system, design_mission, cells):
+    """Designs of a list of cells taken from the design cache of gam, None if one of them is missing
+    """
+    if gam.design_cache is None:
+        return None
+    designs = []
+    for dist, npax in cells:
+        mission = cell_mission(design_mission, dist, npax)
+        try:
+            found, ac_dict = gam.design_cache.lookup(gam, "design_airplane", (power_system, mission))
+        except Exception as error:
+            found, ac_dict = True, error
+        if not found:
+            return None
+        designs.append(ac_dict)
+    return designs
+
+
+def run_cells(tasks, executor=None):
+    """Evaluate the criterion over a list of (gam, power_system, design_mission, criterion, cells) tasks
+    Designs missing from the design cache of their GAM are computed on the executor if one is given and stored in the cache,
+    the cost stage is then evaluated in place.
+    As the design cache ignores prices and the parameters of other technologies, only the designs
+    of the technologies affected by a change of the model are computed again
+    """
+    if executor is None:
+        return [eval_cells(*task) for task in tasks]
+    designs = [cached_cells(gam, power_system, design_mission, cells) for gam, power_system, design_mission, criterion, cells in tasks]
+    futures = {k: executor.submit(design_cells, gam, power_system, design_mission, cells)
+               for k, (gam, power_system, design_mission, criterion, cells) in enumerate(tasks) if designs[k] is None}
+    for k, future in futures.items():
+        gam, power_system, design_mission, criterion, cells = tasks[k]
+        designs[k] = future.result()
+        if gam.design_cache is not None:
+            for (dist, npax), ac_dict in zip(cells, designs[k]):
+                mission = cell_mission(design_mission, dist, npax)
+                gam.design_cache.store(gam, "design_airplane", (power_system, mission), {}, ac_dict)
+    return [cost_cells(task[0], designs[k], task[3]) for k, task in enumerate(tasks)]
+
+
+def find_indexes(jobs, executor=None, workers=None, coarse=5, fine=64):
+    """Compute several domain maps at once, each job is the tuple of arguments of find_index()
+    Designs are evaluated on a coarse x coarse grid which is interpolated on a fine x fine grid to select the best technology
+    Cell evaluations of all jobs and all technologies are spread over the executor if one is given,
+    over a process pool of the given number of workers otherwise, serial evaluation is done if both are None
+    Results are identical to the ones of the serial evaluation
+    """
+    grids = []
+    tasks = []
+    for gam, design_mission, power_system, dist_window, npax_window, criterion in jobs:
+        npax_list = np.linspace(npax_window[0], npax_window[1], coarse)
+        dist_list = np.linspace(dist_window[0], dist_window[1], coarse)
+        grids.append((npax_list, dist_list))
+        for techno in power_system.keys():
+            for dist in dist_list:
+                cells = [(dist, npax) for npax in npax_list]
+                tasks.append((gam, power_system[techno], design_mission, criterion, cells))
+
+    if executor is None and workers is not None and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return find_indexes(jobs, executor=pool, coarse=coarse, fine=fine)
+
+    rows = run_cells(tasks, executor)
+
+    maps = []
+    k = 0
+    for (gam, design_mission, power_system, dist_window, npax_window, criterion), (npax_list, dist_list) in zip(jobs, grids):
+        crit = {}
+        for techno in power_system.keys():
+            crit[techno] = rows[k:k+len(dist_list)]
+            k += len(dist_list)
+        maps.append(select_best(crit, power_system, dist_window, npax_window, dist_list, npax_list, fine))
+    return maps
+
+
+def find_index(gam, design_mission, power_system, dist_window, npax_window, criterion, executor=None, workers=None,
+               coarse=5, fine=64):
     """Draw the domain map
+    Cell evaluations can be spread over an executor or a process pool, see find_indexes() for the grid resolutions
     """
-    npax_list = np.linspace(npax_window[0], npax_window[1], 5)
-    dist_list = np.linspace(dist_window[0], dist_window[1], 5)
-
-    npax_list_2 = np.linspace(npax_window[0], npax_window[1], 64)
-    dist_list_2 = np.linspace(dist_window[0], dist_window[1], 64)
-
-    crit = {}
-    surf = {}
-
-    for techno in power_system.keys():
-        crit[techno] = []
-
-        for dist in dist_list:
-            design_mission["range"] = unit.convert_from("km", dist)
-            crit[techno].append([])
-
-            for npax in npax_list:
-                design_mission["npax"] = npax
-
-                try:
-                    ac_dict = gam.design_airplane(power_system[techno], design_mission)
-                    cost_dict = gam.operating_cost(ac_dict, traffic_zone="west_bound")
-                    all_in_one = {**ac_dict, **cost_dict}
-                    crit[techno][-1].append(all_in_one[criterion])
-                except:
-                    crit[techno][-1].append(np.inf)
-
-        crit_mat = np.array(crit[techno])
-        surf[techno] = RegularGridInterpolator((dist_list, npax_list), crit_mat, bounds_error=False, fill_value=None)
-
-    crit_2 = {}
-    dist_mat, npax_mat = np.meshgrid(dist_list_2, npax_list_2)
-
-    for techno in power_system.keys():
-        crit_2[techno] = surf[techno]((dist_mat.T, npax_mat.T))
-
-    best_tech = []
-    color_ind = []
-    for jd, dist in enumerate(dist_list_2):
-        best_tech.append([])
-        color_ind.append([])
-        for jn, npax in enumerate(npax_list_2):
-            best_tech[-1].append(np.inf)
-            color_ind[-1].append([])
-            for ind, tech in enumerate(power_system.keys()):
-                if crit_2[tech][jd][jn] < best_tech[-1][-1]:
-                    best_tech[-1][-1] = crit_2[tech][jd][jn]
-                    color_ind[-1][-1] = ind
-                    
-    arr         = np.array(color_ind).T
-    flipped_arr = arr[::-1]
-    npax_list = np.linspace(npax_window[0], npax_window[1], 5)
-    dist_list = np.linspace(dist_window[0], dist_window[1], 5)
-    
+    job = (gam, design_mission, power_system, dist_window, npax_window, criterion)
+    return find_indexes([job], executor=executor, workers=workers, coarse=coarse, fine=fine)[0]
+
+
+def select_best(crit, power_system, dist_window, npax_window, dist_list, npax_list, fine=64):
+    """Interpolate the criterion of each technology on the fine grid and retrieve the index of the best one
+    The first technology is kept in case of equality, undefined values never win
+    """
+    npax_list_2 = np.linspace(npax_window[0], npax_window[1], fine)
+    dist_list_2 = np.linspace(dist_window[0], dist_window[1], fine)
+    dist_mat, npax_mat = np.meshgrid(dist_list_2, npax_list_2, indexing="ij")
+
+    crit_2 = np.empty((len(power_system), fine, fine))
+    for ind, techno in enumerate(power_system.keys()):
+        surf = RegularGridInterpolator((dist_list, npax_list), np.array(crit[techno]), bounds_error=False, fill_value=None)
+        crit_2[ind] = surf((dist_mat, npax_mat))
+
+    color_ind = np.argmin(np.where(np.isnan(crit_2), np.inf, crit_2), axis=0)
+
+    flipped_arr = color_ind.T[::-1]
+
     return flipped_arr, npax_list, dist_list
 
+def best_and_gap(crit):
+    """Index of the best technology and relative gap between the two best criteria, crit[..., techno]
+    """
+    crit = np.where(np.isnan(crit), np.inf, crit)
+    best = np.argmin(crit, axis=-1)
+    ordered = np.sort(crit, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gap = (ordered[..., 1] - ordered[..., 0]) / np.abs(ordered[..., 0])
+    gap = np.where(np.isfinite(ordered[..., 0]), gap, np.inf) if crit.shape[-1] > 1 else np.full(best.shape, np.inf)
+    return best, np.where(np.isnan(gap), np.inf, gap)
+
+
+def chain_segments(segments):
+    """Join the segments sharing an end point into polylines
+    """
+    ends = {}
+    for k, (p, q) in enumerate(segments):
+        ends.setdefault(p, []).append(k)
+        ends.setdefault(q, []).append(k)
+    used = set()
+    lines = []
+    for start in sorted(ends, key=lambda p: len(ends[p]) != 1):     # Open lines are walked from one of their ends
+        while True:
+            k = next((m for m in ends[start] if m not in used), None)
+            if k is None:
+                break
+            line = [start]
+            p = start
+            while k is not None:
+                used.add(k)
+                a, b = segments[k]
+                p = b if a == p else a
+                line.append(p)
+                k = next((m for m in ends[p] if m not in used), None)
+            lines.append(line)
+    return lines
+
+
+def find_index_adaptive(gam, design_mission, power_system, dist_window, npax_window, criterion, executor=None, workers=None,
+                        coarse=5, fine=64, budget=None, gap=0.002):
+    """Draw the domain map refining the grid only where the best technology is questionable
+    Cells of the coarse x coarse grid are recursively split in four when the best technologies at their corners differ
+    or when the relative gap between the two best criteria at one corner is lower than gap.
+    Refinement stops when the resolution reaches fine points per axis or when the budget of design evaluations is exhausted
+    Retrieves (color_ind, npax_list, dist_list, boundaries, n_eval) where color_ind is drawn at the final resolution and
+    boundaries is a list of dictionaries {"technos": (tech1, tech2), "dist": km, "npax": seat} giving the polylines
+    which separate the domains of two technologies
+    """
+    if executor is None and workers is not None and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return find_index_adaptive(gam, design_mission, power_system, dist_window, npax_window, criterion,
+                                       executor=pool, coarse=coarse, fine=fine, budget=budget, gap=gap)
+
+    technos = list(power_system.keys())
+    level = max(0, int(np.ceil(np.log2((fine - 1) / (coarse - 1)))))
+    n = (coarse - 1) * 2**level + 1
+    dist_list_2 = np.linspace(dist_window[0], dist_window[1], n)
+    npax_list_2 = np.linspace(npax_window[0], npax_window[1], n)
+
+    nodes = {}      # (i, j) indices on the final grid : criterion of each technology
+
+    def evaluate(keys):
+        keys = sorted(keys)
+        tasks = []
+        for techno in technos:
+            for k in range(0, len(keys), coarse):
+                cells = [(dist_list_2[i], npax_list_2[j]) for i, j in keys[k:k+coarse]]
+                tasks.append((gam, power_system[techno], design_mission, criterion, cells))
+        rows = iter(run_cells(tasks, executor))
+        values = {key: [] for key in keys}
+        for techno in technos:
+            for k in range(0, len(keys), coarse):
+                for key, value in zip(keys[k:k+coarse], next(rows)):
+                    values[key].append(value)
+        for key in keys:
+            nodes[key] = np.array(values[key], dtype=float)
+
+    def corners(cell):
+        i, j, h = cell
+        return [(i, j), (i+h, j), (i+h, j+h), (i, j+h)]
+
+    def priority(cell):
+        best, node_gap = best_and_gap(np.array([nodes[key] for key in corners(cell)]))
+        return (len(set(best)) == 1, np.min(node_gap))
+
+    step = 2**level
+    leaves = [(i, j, step) for i in range(0, n-1, step) for j in range(0, n-1, step)]
+    evaluate({key for cell in leaves for key in corners(cell)})
+
+    while True:
+        candidates = []
+        for cell in leaves:
+            if cell[2] > 1:
+                uniform, min_gap = priority(cell)
+                if not uniform or min_gap < gap:
+                    candidates.append((uniform, min_gap, cell))
+        candidates.sort()       # Changes of the best technology first, then the closest criteria
+
+        split = set()
+        new_keys = set()
+        for uniform, min_gap, (i, j, h) in candidates:
+            g = h // 2
+            keys = {(i+g, j), (i+h, j+g), (i+g, j+h), (i, j+g), (i+g, j+g)} - nodes.keys() - new_keys
+            if budget is not None and (len(nodes) + len(new_keys) + len(keys)) * len(technos) > budget:
+                break
+            split.add((i, j, h))
+            new_keys |= keys
+        if len(split) == 0:
+            break
+
+        evaluate(new_keys)
+        children = [(i+di, j+dj, h//2) for i, j, h in split for di in (0, h//2) for dj in (0, h//2)]
+        leaves = [cell for cell in leaves if cell not in split] + children
+
+    # Bilinear interpolation of the criteria inside each leaf
+    crit_2 = np.empty((n, n, len(technos)))
+    for i, j, h in leaves:
+        c00, c10, c11, c01 = [nodes[key] for key in corners((i, j, h))]
+        u = np.linspace(0., 1., h+1)[:, None, None]
+        v = np.linspace(0., 1., h+1)[None, :, None]
+        with np.errstate(invalid="ignore"):
+            crit_2[i:i+h+1, j:j+h+1] = (1-u)*(1-v)*c00 + u*(1-v)*c10 + u*v*c11 + (1-u)*v*c01
+        for key, value in [((i, j), c00), ((i+h, j), c10), ((i+h, j+h), c11), ((i, j+h), c01)]:
+            crit_2[key] = value     # Evaluated points are kept exact
+    color_ind, _ = best_and_gap(crit_2)
+
+    # Boundaries cross the edges of the leaves whose ends have different best technologies
+    def crossing(a, b):
+        a, b = sorted([a, b])
+        wa, wb = best_and_gap(nodes[a])[0], best_and_gap(nodes[b])[0]
+        da = nodes[a][wa] - nodes[a][wb]
+        db = nodes[b][wa] - nodes[b][wb]
+        t = da / (da - db) if np.isfinite(da) and np.isfinite(db) and da != db else 0.5
+        point = (a[0] + t*(b[0]-a[0]), a[1] + t*(b[1]-a[1]))
+        return tuple(sorted([technos[wa], technos[wb]])), (round(point[0], 9), round(point[1], 9))
+
+    segments = {}
+    for cell in leaves:
+        keys = corners(cell)
+        points = {}
+        for a, b in zip(keys, keys[1:] + keys[:1]):
+            if best_and_gap(nodes[a])[0] != best_and_gap(nodes[b])[0]:
+                pair, point = crossing(a, b)
+                points.setdefault(pair, []).append(point)
+        for pair, pts in points.items():
+            if len(pts) == 2:
+                segments.setdefault(pair, []).append((pts[0], pts[1]))
+            else:       # Several technologies meet inside the cell
+                center = (round(cell[0] + 0.5*cell[2], 9), round(cell[1] + 0.5*cell[2], 9))
+                segments.setdefault(pair, []).extend([(pt, center) for pt in pts])
+
+    boundaries = []
+    for pair, segs in segments.items():
+        for line in chain_segments(segs):
+            line = np.array(line)
+            boundaries.append({"technos": pair,
+                               "dist": np.interp(line[:, 0], np.arange(n), dist_list_2),
+                               "npax": np.interp(line[:, 1], np.arange(n), npax_list_2)})
+
+    npax_list = np.linspace(npax_window[0], npax_window[1], coarse)
+    dist_list = np.linspace(dist_window[0], dist_window[1], coarse)
+
+    return color_ind.T[::-1], npax_list, dist_list, boundaries, len(nodes) * len(technos)
+
 def draw_domains(color_ind, npax_list, dist_list, power_system, criterion, ax):
     
     # print(flipped_arr)
@@ -9,16 +9,22 @@ Created on Thu Jan 20 20:20:20 2020
 import streamlit as st
 import numpy as np
 import pandas as pd
-from scipy.optimize import fsolve
 from scipy.interpolate import interp1d
 
+import operator
+import os
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
+from itertools import repeat
+from collections.abc import Mapping
 
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 
 from gam_utils import data_analysis as uda
+from gam_utils.cache import DesignCache, cached_design, fingerprint
 from gam_utils import math as umath
+from gam_utils import solver as usolver
 from gam_utils import unit
 
 from gam_utils.physical_data import PhysicalData
@@ -26,6 +32,67 @@ from gam_utils.physical_data import PhysicalData
 phd = PhysicalData()
 
 
+# --------------------------------------------------------------------------------------------------
+#
+#  Compiled power system
+#
+# --------------------------------------------------------------------------------------------------
+
+class PowerSystem(Mapping):
+    """
+    Immutable power system built by GAM.compile_power_system()
+    It behaves as the power_system dictionary it was built from and carries the constants of the power system
+    (heating value, fuel density, efficiency coefficients, mass factors) so that they are not looked up again
+    at each evaluation
+
+    WARNING : constants are evaluated with the GAM parameters at compilation time, GAM.compile_power_system()
+    compiles the object again when these parameters have changed since, see GAM.technology_state()
+    """
+
+    def __init__(self, data, **constants):
+        object.__setattr__(self, "data", dict(data))
+        for key, value in constants.items():
+            object.__setattr__(self, key, value)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __setattr__(self, key, value):
+        raise Exception("PowerSystem object is immutable, compile a new one")
+
+    def __repr__(self):
+        return "PowerSystem(" + repr(self.data) + ")"
+
+    def engine_eff(self, tas, max_power):
+        """Overall efficiency of the power system, tas and max_power can be arrays
+        """
+        if self.eff_model == "turboprop":
+            a, b, c = self.psfc_coef
+            psfc_ref = (a + b / unit.kW_W(max_power)**c) * self.psfc_unit
+            return self.eff_factor / (self.fhv_turboshaft * psfc_ref)
+        elif self.eff_model == "turbofan":
+            eff_pr = 1 / (0.5 + np.sqrt(0.25 + (self.jet_factor / (2 * (1 + self.data["bpr"]) * tas ** 2))))
+            return self.eff_th * eff_pr * self.eff_factor
+        else:
+            return self.eff_const
+
+    def propulsion_mass(self, total_power):
+        """Masses of the propulsion system and of the fuel cell system, see GAM.propulsion_mass()
+        """
+        return total_power * self.propulsion_factor, total_power * self.fuel_cell_factor
+
+    def energy_storage_mass(self, max_fuel, max_enrg):
+        """Mass of tanks or batteries and fuel density, see GAM.energy_storage_mass()
+        """
+        return max_fuel * self.fuel_storage_factor + max_enrg * self.enrg_storage_factor, self.fuel_density
+
+
 # --------------------------------------------------------------------------------------------------
 #
 #  Main class
@@ -40,6 +107,25 @@ class GAM(object):
     and fly the resulting aircraft over give routes
     """
 
+    # Parameters read by the economic stage of operating_cost() only, see economic_cost()
+    cost_parameters = ["util_dist_list", "util_list", "energy_price", "cost_range", "cost_data", "tech_data",
+                       "traffic_zone_factor"]
+
+    # Parameters read by the design and flight models through compile_power_system() only
+    technology_parameters = ["prop_eff", "fan_eff", "emotor_eff", "fuel_cell_eff", "prop_system_eff",
+                             "psfc_piston", "fhv_piston", "psfc_turboshaft_coef", "fhv_turboshaft",
+                             "eff_th_turbofan", "fuel_mixture", "power_density",
+                             "battery_enrg_density", "battery_vol_density", "tank_efficiency_factor",
+                             "initial_gh2_pressure", "gh2_density", "gh2_tank_gravimetric_index", "gh2_tank_volumetric_index",
+                             "lh2_density", "lh2_tank_gravimetric_index", "lh2_tank_volumetric_index",
+                             "lch4_density", "lch4_tank_gravimetric_index", "lch4_tank_volumetric_index",
+                             "initial_lnh3_pressure", "lnh3_density", "lnh3_tank_gravimetric_index", "lnh3_tank_volumetric_index"]
+
+    # Technology parameters that are modified in place rather than assigned, see technology_state()
+    technology_containers = ["psfc_turboshaft_coef", "power_density"]
+
+    technology_contents = operator.attrgetter(*technology_containers)
+
     def __init__(self):
 
         # ----------------------------------------------------------------------------------
@@ -349,11 +435,15 @@ class GAM(object):
                                     "east_bound": 0.6}
 
         # -------------------------------------------------------------------------------------------------------------------
-        """Dictionary definitions
+        """Design cache, disabled by default, see enable_design_cache()
         """
-        self.flight_altitude_out = {"airplane_type": None, "mission": None, "diversion": None, "holding": None}
-        self.reserve_data_out = {"airplane_type": None, "fuel_factor": None, "diversion_leg": None, "holding_time": None}
+        self.design_cache = None
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in GAM.technology_parameters:
+            # A new stamp invalidates the PowerSystem objects compiled before, see compile_power_system()
+            object.__setattr__(self, "technology_stamp", object())
 
 
     def print_model_data(self):
@@ -488,6 +578,52 @@ class GAM(object):
         print("           gam.take_off_time = ", "%.0f" % self.take_off_time, " s, 30s take off + initial climb")
         print("         gam.full_power_time = ", "%.0f" % self.full_power_time, " s, 15s take off + initial climb, for hybrid only")
 
+    #-------------------------------------------------------------------------------------------------------------------
+    """Design cache, memoizing design_airplane(), design_from_mtow() and build_payload_range()
+    """
+    def enable_design_cache(self, maxsize=256, cache=None):
+        """Enable the design cache, an existing DesignCache object can be given to share it between GAM instances
+        Cached results are keyed on the arguments and on the model parameters they depend on, see model_fingerprint()
+        """
+        self.design_cache = cache if cache is not None else DesignCache(maxsize=maxsize)
+        return self.design_cache
+
+    def snapshot(self):
+        """Return an independent copy of the model parameters, evaluations on the copy are not affected
+        by later changes of self and conversely, the design cache is shared
+        """
+        return deepcopy(self)
+
+    def disable_design_cache(self):
+        self.design_cache = None
+
+    def design_cache_info(self):
+        """Return hits, misses, size and maxsize of the design cache, None if it is disabled
+        """
+        if self.design_cache is None:
+            return None
+        return self.design_cache.info()
+
+    def model_fingerprint(self, stage=None, subject=None):
+        """Digest of all model parameters, any change of a parameter changes the fingerprint
+        Graphic settings are ignored
+        With stage = "sizing", only the parameters of the design and flight models are kept : cost parameters are ignored
+        and technology parameters are replaced by the constants of the compiled power system of subject,
+        a power_system or an airplane dictionary. The fingerprint of one technology is then not affected by
+        the parameters of the others nor by prices
+        """
+        ignored = ["design_cache", "colors", "technology_stamp"]
+        if stage is None:
+            return fingerprint({k: v for k, v in vars(self).items() if k not in ignored})
+        elif stage == "sizing":
+            ignored += self.cost_parameters + self.technology_parameters
+            power_system = subject["power_system"] if "power_system" in subject else subject
+            # The state of the compiled power system holds all technology parameters, only its constants are kept
+            constants = {k: v for k, v in vars(self.compile_power_system(power_system)).items() if k != "state"}
+            return fingerprint(({k: v for k, v in vars(self).items() if k not in ignored}, constants))
+        else:
+            raise Exception("model_fingerprint, stage is unknown")
+
     #-------------------------------------------------------------------------------------------------------------------
     """Low level sub-models
     """
@@ -512,26 +648,24 @@ class GAM(object):
         return nr
 
     def flight_altitude(self, airplane_type, cruise_altp=None):
-        """return [cruise altitude, diversion altitude, holding altitude]
+        """return a new dictionary with cruise altitude, diversion altitude, holding altitude
         """
         mz, dz, hz = self.flight_altitudes[airplane_type]
         if cruise_altp is not None:
             mz = cruise_altp
-        self.flight_altitude_out["airplane_type"] = airplane_type
-        self.flight_altitude_out["mission"] = mz
-        self.flight_altitude_out["diversion"] = dz
-        self.flight_altitude_out["holding"] = hz
-        return self.flight_altitude_out
+        return {"airplane_type": airplane_type,
+                "mission": mz,
+                "diversion": dz,
+                "holding": hz}
 
     def reserve_data(self, airplane_type):
-        """return [mission fuel factor, diversion leg, holding time]
+        """return a new dictionary with mission fuel factor, diversion leg, holding time
         """
         ff, dl, ht = self.reserve_parameters[airplane_type]
-        self.reserve_data_out["airplane_type"] = airplane_type
-        self.reserve_data_out["fuel_factor"] = ff
-        self.reserve_data_out["diversion_leg"] = dl
-        self.reserve_data_out["holding_time"] = ht
-        return self.reserve_data_out
+        return {"airplane_type": airplane_type,
+                "fuel_factor": ff,
+                "diversion_leg": dl,
+                "holding_time": ht}
 
     def get_lod(self, mtow, force_model=False):
         """Return L/D estimation or user input
@@ -621,6 +755,119 @@ class GAM(object):
             raise Exception("energy type is unknown")
         return eff
 
+    def get_engine_eff(self, power_system, tas, max_power):
+        """Return the overall efficiency of the power system, tas and max_power can be arrays
+        """
+        return self.compile_power_system(power_system).engine_eff(tas, max_power)
+
+    def technology_state(self):
+        """Stamp of the last assignment of a technology parameter and contents of the technology containers,
+        the constants of a PowerSystem object are valid while they do not change
+        """
+        return self.technology_stamp, self.technology_contents(self)
+
+    def compile_power_system(self, power_system):
+        """Build the immutable PowerSystem object of a power_system dictionary, see design_airplane() for its keys
+        Efficiency coefficients and mass factors are evaluated once with the current GAM parameters,
+        the object can then be used in place of the dictionary by all methods
+        A PowerSystem object is returned unchanged if it was compiled with the current technology parameters,
+        it is compiled again from its dictionary otherwise
+        """
+        state = self.technology_state()
+        if isinstance(power_system, PowerSystem):
+            if power_system.state == state:
+                return power_system
+            power_system = power_system.data
+
+        data = {"bpr": None, **power_system}
+        energy_type = data["energy_type"]
+        engine_type = data["engine_type"]
+        thruster_type = data["thruster_type"]
+
+        battery = energy_type == self.battery
+        fhv = None if battery else phd.fuel_heat(energy_type)
+
+        eff_data = {}
+        fuel_cell_factor = 0.
+        if engine_type == self.piston:
+            eff_data["eff_const"] = self.get_piston_eff()
+            propulsion_factor = 1. / self.power_density[engine_type] + 1. / self.power_density[self.propeller]
+        elif engine_type == self.turboprop:
+            eff_data = {"psfc_coef": tuple(self.psfc_turboshaft_coef),
+                        "psfc_unit": unit.convert_from("kg/kW/h", 1.),
+                        "eff_factor": self.prop_eff * self.prop_system_eff,
+                        "fhv_turboshaft": self.fhv_turboshaft}
+            propulsion_factor = 1. / self.power_density[engine_type] + 1. / self.power_density[self.propeller]
+        elif engine_type == self.turbofan:
+            eff_data = {"jet_factor": self.fuel_mixture * self.eff_th_turbofan * fhv,
+                        "eff_th": self.eff_th_turbofan,
+                        "eff_factor": self.prop_system_eff}
+            propulsion_factor = 1. / self.power_density[engine_type]
+        elif engine_type == self.emotor:
+            propulsion_factor = 1. / self.power_density[engine_type] + 1. / self.power_density[self.power_elec]
+            if thruster_type == self.fan:
+                propulsion_factor += 1. / self.power_density[self.fan]
+            elif thruster_type == self.propeller:
+                propulsion_factor += 1. / self.power_density[self.propeller]
+            else:
+                raise Exception("target power system - thruster type is unknown")
+
+            if energy_type in [self.gh2, self.lh2]:
+                fuel_cell_factor = (1. / self.emotor_eff) / self.power_density[self.fuel_cell]
+            elif energy_type == self.battery:
+                pass
+            else:
+                raise Exception("target power system - energy_type is unknown")
+            eff_data["eff_const"] = self.get_emotor_eff(energy_type, thruster_type)
+        else:
+            raise Exception("power system, engine type is unknown")
+
+        fuel_storage_factor = 0.
+        enrg_storage_factor = 0.
+        tank_price_key = None
+        if energy_type in [self.kerosene, self.e_fuel, self.gasoline, self.petrol]:
+            fuel_density = phd.fuel_density(energy_type)
+        elif energy_type == self.gh2:
+            fuel_density = phd.fuel_density(self.gh2, press=self.initial_gh2_pressure)
+            gh2_tank_gravimetric_index = 1 / (
+                    1 + self.initial_gh2_pressure / (self.tank_efficiency_factor * fuel_density))
+            fuel_storage_factor = 1. / gh2_tank_gravimetric_index - 1.
+            tank_price_key = "gh2_tank_mass_price"
+        elif energy_type == self.lh2:
+            fuel_density = phd.fuel_density(self.lh2)
+            fuel_storage_factor = 1. / self.lh2_tank_gravimetric_index - 1.
+            tank_price_key = "lh2_tank_mass_price"
+        elif energy_type == self.lch4:
+            fuel_density = phd.fuel_density(self.lch4)
+            fuel_storage_factor = 1. / self.lch4_tank_gravimetric_index - 1.
+            tank_price_key = "lh2_tank_mass_price"
+        elif energy_type == self.lnh3:
+            fuel_density = phd.fuel_density(self.lnh3)
+            lnh3_tank_gravimetric_index = 1 / (
+                    1 + self.initial_lnh3_pressure / (self.tank_efficiency_factor * fuel_density))
+            fuel_storage_factor = 1. / lnh3_tank_gravimetric_index - 1.
+            tank_price_key = "lh2_tank_mass_price"
+        elif energy_type == self.battery:
+            fuel_density = phd.fuel_density(self.battery)
+            enrg_storage_factor = 1. / self.battery_enrg_density
+        else:
+            raise Exception("energy_type is unknown")
+
+        return PowerSystem(data,
+                           state=(state[0], deepcopy(state[1])),
+                           eff_model=engine_type,
+                           is_battery=battery,
+                           is_emotor=engine_type == self.emotor,
+                           has_fuel_cell=0. < fuel_cell_factor,
+                           fhv=fhv,
+                           fuel_density=fuel_density,
+                           propulsion_factor=propulsion_factor,
+                           fuel_cell_factor=fuel_cell_factor,
+                           fuel_storage_factor=fuel_storage_factor,
+                           enrg_storage_factor=enrg_storage_factor,
+                           tank_price_key=tank_price_key,
+                           **eff_data)
+
     def ref_power(self, mtow):
         """Required total generic power for an airplane with a given MTOW
         This sub-model is a key element of the method
@@ -678,69 +925,12 @@ class GAM(object):
     def propulsion_mass(self, power_system, total_power):
         """Estimates the mass of the propulsion system according to the selected architecture
         """
-        energy_type = power_system["energy_type"]
-        engine_type = power_system["engine_type"]
-        thruster_type = power_system["thruster_type"]
-
-        fuel_cell_system_mass = 0
-        if engine_type == self.piston:
-            propulsion_mass = total_power / self.power_density[engine_type]
-            propulsion_mass += total_power / self.power_density[self.propeller]
-        elif engine_type == self.turboprop:
-            propulsion_mass = total_power / self.power_density[engine_type]
-            propulsion_mass += total_power / self.power_density[self.propeller]
-        elif engine_type == self.turbofan:
-            propulsion_mass = total_power / self.power_density[engine_type]
-        elif engine_type == self.emotor:
-            propulsion_mass = total_power / self.power_density[engine_type]
-            propulsion_mass += total_power / self.power_density[self.power_elec]
-            if thruster_type == self.fan:
-                propulsion_mass += total_power / self.power_density[self.fan]
-            elif thruster_type == self.propeller:
-                propulsion_mass += total_power / self.power_density[self.propeller]
-            else:
-                raise Exception("target power system - thruster type is unknown")
-
-            if energy_type in [self.gh2, self.lh2]:
-                fuel_cell_system_mass = (total_power / self.emotor_eff) / self.power_density[self.fuel_cell]
-            elif energy_type == self.battery:
-                pass
-            else:
-                raise Exception("target power system - energy_type is unknown")
-        else:
-            raise Exception("engine type is unknown")
-
-        return propulsion_mass, fuel_cell_system_mass
+        return self.compile_power_system(power_system).propulsion_mass(total_power)
 
     def energy_storage_mass(self, power_system, max_fuel, max_enrg):
         """Compute fuel and or energy storage mass
         """
-        energy_storage_mass = 0.
-        if power_system["energy_type"] in [self.kerosene, self.e_fuel, self.gasoline, self.petrol]:
-            fuel_density = phd.fuel_density(power_system["energy_type"])
-        elif power_system["energy_type"] == self.gh2:
-            fuel_density = phd.fuel_density(self.gh2, press=self.initial_gh2_pressure)
-            self.gh2_tank_gravimetric_index = 1 / (
-                    1 + self.initial_gh2_pressure / (self.tank_efficiency_factor * fuel_density))
-            energy_storage_mass += max_fuel * (1. / self.gh2_tank_gravimetric_index - 1.)
-        elif power_system["energy_type"] == self.lh2:
-            fuel_density = phd.fuel_density(self.lh2)
-            energy_storage_mass += max_fuel * (1. / self.lh2_tank_gravimetric_index - 1.)
-        elif power_system["energy_type"] == self.lch4:
-            fuel_density = phd.fuel_density(self.lch4)
-            energy_storage_mass += max_fuel * (1. / self.lch4_tank_gravimetric_index - 1.)
-        elif power_system["energy_type"] == self.lnh3:
-            fuel_density = phd.fuel_density(self.lnh3)
-            self.lnh3_tank_gravimetric_index = 1 / (
-                    1 + self.initial_lnh3_pressure / (self.tank_efficiency_factor * fuel_density))
-            energy_storage_mass += max_fuel * (1. / self.lnh3_tank_gravimetric_index - 1.)
-        elif power_system["energy_type"] == self.battery:
-            fuel_density = phd.fuel_density(self.battery)
-            energy_storage_mass += max_enrg / self.battery_enrg_density
-        else:
-            raise Exception("energy_type is unknown")
-
-        return energy_storage_mass, fuel_density
+        return self.compile_power_system(power_system).energy_storage_mass(max_fuel, max_enrg)
 
     def owe_structure(self, category, npax, mtow, distance, total_power, max_fuel, max_enrg, power_system):
         """Compute OWE from the point of view of structures
@@ -772,6 +962,17 @@ class GAM(object):
     #-------------------------------------------------------------------------------------------------------------------
     """Model components for mission fuel estimation
     """
+    def get_speed_type(self, speed):
+        """Speeds greater than 1 are true air speeds, others are Mach numbers
+        Return None for arrays, the type is then resolved element wise by get_tas()
+        """
+        if np.ndim(speed) > 0:
+            return None
+        elif speed > 1:
+            return "tas"
+        else:
+            return "mach"
+
     def get_tas(self, tamb, speed, speed_type):
         vsnd = phd.sound_speed(tamb)
         if speed_type == "mach":
@@ -780,32 +981,37 @@ class GAM(object):
         elif speed_type == "tas":
             mach = speed / vsnd
             return speed, mach
+        elif speed_type is None:
+            tas = np.where(speed > 1, speed, speed * vsnd)
+            return tas, tas / vsnd
+
+    def true_air_speed(self, speed, altp, disa=0.):
+        """True air speeds of speeds given as Mach numbers or true air speeds, see get_speed_type(), at altitudes altp
+        Arrays are treated element wise
+        """
+        speed = np.asarray(speed, dtype=float)
+        pamb, tamb, tstd, dtodz = phd.atmosphere(np.asarray(altp, dtype=float), disa)
+        tas, mach = self.get_tas(tamb, speed, None)
+        return tas
 
     def leg_fuel(self, start_mass, distance, altp, speed, speed_type, mtow, max_power, power_system):
         """Compute fuel and or energy over a given distance
+        All numerical inputs can be arrays, they are broadcast together
         """
         pamb, tamb, g = phd.atmosphere_g(altp, self.disa)
         tas, mach = self.get_tas(tamb, speed, speed_type)
 
+        power_system = self.compile_power_system(power_system)
+
         time = distance / tas
         lod = self.get_lod(mtow)
+        eff = power_system.engine_eff(tas, max_power)
 
-        if power_system["engine_type"] == self.piston:
-            eff = self.get_piston_eff()
-        elif power_system["engine_type"] == self.turboprop:
-            eff = self.get_turboprop_eff(max_power)
-        elif power_system["engine_type"] == self.turbofan:
-            eff = self.get_turbofan_eff(tas, power_system["bpr"], power_system["energy_type"])
-        elif power_system["engine_type"] == self.emotor:
-            eff = self.get_emotor_eff(power_system["energy_type"], power_system["thruster_type"])
-        else:
-            raise Exception("power system, engine type is unknown")
-
-        if power_system["energy_type"] == self.battery:
-            fuel = 0.
+        if power_system.is_battery:
             enrg = start_mass * g * distance / (eff * lod)      # Airplane mass is constant
+            fuel = np.zeros_like(enrg) if np.ndim(enrg) > 0 else 0.
         else:
-            fhv = phd.fuel_heat(power_system["energy_type"])
+            fhv = power_system.fhv
             fuel = start_mass * (1. - np.exp(-(g * distance) / (eff * fhv * lod)))
             enrg = fuel * fhv
 
@@ -813,30 +1019,23 @@ class GAM(object):
 
     def holding_fuel(self, start_mass, time, altp, speed, speed_type, mtow, max_power, power_system):
         """Compute the fuel for a given holding time
+        All numerical inputs can be arrays, they are broadcast together
         WARNING : when fuel is used, returned value is fuel mass (kg)
                   when battery is used, returned value is energy (J)
         """
         pamb, tamb, g = phd.atmosphere_g(altp, self.disa)
         tas,mach = self.get_tas(tamb, speed, speed_type)
 
-        lod = self.get_lod(mtow)
+        power_system = self.compile_power_system(power_system)
 
-        if power_system["engine_type"] == self.piston:
-            eff = self.get_piston_eff()
-        elif power_system["engine_type"] == self.turboprop:
-            eff = self.get_turboprop_eff(max_power)
-        elif power_system["engine_type"] == self.turbofan:
-            eff = self.get_turbofan_eff(tas, power_system["bpr"], power_system["energy_type"])
-        elif power_system["engine_type"] == self.emotor:
-            eff = self.get_emotor_eff(power_system["energy_type"], power_system["thruster_type"])
-        else:
-            raise Exception("power system, engine type is unknown")
+        lod = self.get_lod(mtow)
+        eff = power_system.engine_eff(tas, max_power)
 
-        if power_system["energy_type"] == self.battery:
-            fuel = 0.
+        if power_system.is_battery:
             enrg = start_mass * g * tas * time / (eff * lod)      # Airplane mass is constant
+            fuel = np.zeros_like(enrg) if np.ndim(enrg) > 0 else 0.
         else:
-            fhv = phd.fuel_heat(power_system["energy_type"])
+            fhv = power_system.fhv
             fuel = start_mass * (1. - np.exp(-(g * tas * time) / (eff * fhv * lod)))
             enrg = fuel * fhv
 
@@ -844,13 +1043,13 @@ class GAM(object):
 
     def total_fuel(self, tow, distance, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data):
         """Compute the total fuel required for a mission
+        All numerical inputs, including the values of altitude_data and reserve_data, can be arrays,
+        missions are then evaluated together in one pass and all outputs are arrays
         WARNING : when fuel is used, returned value is fuel mass (kg)
                   when battery is used, returned value is energy (J)
         """
-        if cruise_speed > 1:
-            speed_type = "tas"
-        else:
-            speed_type = "mach"
+        power_system = self.compile_power_system(power_system)
+        speed_type = self.get_speed_type(cruise_speed)
 
         max_power = total_power / power_system["engine_count"]
         cruise_altp = altitude_data["mission"]
@@ -860,14 +1059,14 @@ class GAM(object):
 
         mission_enrg += self.take_off_energy(total_power)
         mission_enrg += self.climb_energy(tow, cruise_altp)
-        if power_system["energy_type"] != self.battery:
-            mission_fuel += mission_enrg * (self.fuel_energy_ratio / phd.fuel_heat(power_system["energy_type"]))
+        if not power_system.is_battery:
+            mission_fuel += mission_enrg * (self.fuel_energy_ratio / power_system.fhv)
 
         fuel, enrg, mission_lod, global_eff, mission_time = self.leg_fuel(tow, distance, cruise_altp, cruise_speed, speed_type, mtow, max_power, power_system)
         mission_fuel += fuel
         mission_enrg += enrg
 
-        if power_system["energy_type"] != self.battery:
+        if not power_system.is_battery:
             ldw = tow - mission_fuel
         else:
             ldw = tow
@@ -875,16 +1074,17 @@ class GAM(object):
         reserve_fuel = 0.
         reserve_enrg = 0.
 
-        if reserve_data["fuel_factor"] > 0:
+        # Reserve terms are zero where their parameter is zero
+        if np.any(reserve_data["fuel_factor"] > 0):
             reserve_fuel += reserve_data["fuel_factor"] * mission_fuel
             reserve_enrg += reserve_data["fuel_factor"] * mission_enrg
-        if reserve_data["diversion_leg"] > 0:
+        if np.any(reserve_data["diversion_leg"] > 0):
             leg = reserve_data["diversion_leg"]
             diversion_altp = altitude_data["diversion"]
             lf, le, lod, eff, time = self.leg_fuel(ldw, leg, diversion_altp, cruise_speed, speed_type, mtow, max_power, power_system)
             reserve_fuel += lf
             reserve_enrg += le
-        if reserve_data["holding_time"] > 0:
+        if np.any(reserve_data["holding_time"] > 0):
             time = reserve_data["holding_time"]
             holding_altp = altitude_data["holding"]
             speed = 1. * cruise_speed
@@ -904,6 +1104,87 @@ class GAM(object):
                 "global_eff": global_eff,
                 "mission_time": mission_time}
 
+    def mission_law(self, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data):
+        """Coefficients of the mission fuel model of total_fuel() for a given airplane
+        For a given airplane, the fuel model is linear in mass and exponential in distance,
+        it can be inverted in closed form, see tow_from_distance() and distance_from_tow()
+
+        WARNING : for battery airplanes, k_mission is the energy per unit mass and distance
+                  and reserve_ratio the reserve energy per unit mass
+        """
+        speed_type = self.get_speed_type(cruise_speed)
+
+        power_system = self.compile_power_system(power_system)
+        battery = power_system.is_battery
+        fhv = 1. if battery else power_system.fhv
+
+        max_power = total_power / power_system["engine_count"]
+        lod = self.get_lod(mtow)
+
+        def leg_factor(altp):
+            # Exponent of the Breguet equation per unit distance, and true air speed
+            pamb, tamb, g = phd.atmosphere_g(altp, self.disa)
+            tas, mach = self.get_tas(tamb, cruise_speed, speed_type)
+            eff = power_system.engine_eff(tas, max_power)
+            return g / (eff * fhv * lod), tas
+
+        k_mission, tas = leg_factor(altitude_data["mission"])
+
+        reserve_k = []
+        if reserve_data["diversion_leg"] > 0:
+            k, tas = leg_factor(altitude_data["diversion"])
+            reserve_k.append(k * reserve_data["diversion_leg"])
+        if reserve_data["holding_time"] > 0:
+            k, tas = leg_factor(altitude_data["holding"])
+            reserve_k.append(k * tas * reserve_data["holding_time"])
+
+        if battery:
+            reserve_ratio = sum(reserve_k)
+        else:
+            reserve_ratio = sum([1. - np.exp(-k) for k in reserve_k])
+
+        return {"battery": battery,
+                "fhv": fhv,
+                "fixed_enrg": self.take_off_energy(total_power),
+                "climb_enrg": self.climb_energy(1., altitude_data["mission"]),
+                "k_mission": k_mission,
+                "fuel_factor": reserve_data["fuel_factor"],
+                "reserve_ratio": reserve_ratio}
+
+    def tow_from_distance(self, law, distance, owe, payload):
+        """Take off weight of a fuel airplane flying a given distance with a given payload, see mission_law()
+        Total fuel is linear versus TOW so the mission balance is solved directly
+        Return None if there is no physical solution, distance and payload can be arrays, NaN then marks the missions
+        without physical solution
+        """
+        r = self.fuel_energy_ratio / law["fhv"]
+        c = 1. + law["fuel_factor"] - law["reserve_ratio"]
+        a = r * law["fixed_enrg"]
+        b = r * law["climb_enrg"] + 1. - np.exp(-law["k_mission"] * distance)
+        den = 1. - b * c - law["reserve_ratio"]
+        if law["battery"]:
+            return None
+        if np.ndim(den) == 0:
+            return (owe + payload + a * c) / den if den > 0. else None
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(den > 0., (owe + payload + a * c) / den, np.nan)
+
+    def distance_from_tow(self, law, tow, total):
+        """Distance flown by an airplane with a given TOW when it burns a given total fuel, see mission_law()
+        WARNING : for battery airplanes, total is the total energy
+        Return None if there is no physical solution
+        """
+        if law["battery"]:
+            cruise_enrg = (total - tow * law["reserve_ratio"]) / (1. + law["fuel_factor"]) \
+                          - law["fixed_enrg"] - tow * law["climb_enrg"]
+            return cruise_enrg / (tow * law["k_mission"])
+        r = self.fuel_energy_ratio / law["fhv"]
+        mission_fuel = (total - law["reserve_ratio"] * tow) / (1. + law["fuel_factor"] - law["reserve_ratio"])
+        z = 1. - (mission_fuel - r * (law["fixed_enrg"] + tow * law["climb_enrg"])) / tow
+        if z <= 0.:
+            return None
+        return -np.log(z) / law["k_mission"]
+
     def owe_performance(self, payload, mtow, range, cruise_speed, total_power, power_system, altitude_data, reserve_data):
         """Compute OWE from the point of view of mission
         energy_storage_mass contains the battery weight or tank weight for GH2 or LH2 storage
@@ -928,6 +1209,125 @@ class GAM(object):
                 "aerodynamic_efficiency": this_dict["mission_lod"],
                 "propulsion_system_efficiency": this_dict["global_eff"]}
 
+    #-------------------------------------------------------------------------------------------------------------------
+    """Analytic derivatives of model components, used by the Newton solvers
+    """
+    def ref_power_derivative(self, mtow):
+        """Derivative of ref_power() versus MTOW
+        """
+        a, b, c = self.ref_power_factors
+        return 2. * a * mtow + b
+
+    def standard_mass_derivative(self, mtow):
+        """Derivative of standard_mass() versus MTOW
+        """
+        a, b, c = self.standard_af_mwe_factors
+        return 2. * a * mtow + b
+
+    def get_lod_derivative(self, mtow, dmtow=0., dlod_factor=0.):
+        """Derivative of get_lod() given the derivatives of MTOW and of lod_factor
+        L/D model is piecewise linear versus MTOW and constant outside the table
+        """
+        if self.lod != "model":
+            return 0.
+        mtow_list, lod_list = self.lod_mtow_list, self.lod_list
+        j = int(np.clip(np.searchsorted(mtow_list, mtow, side="right") - 1, 0, len(mtow_list) - 2))
+        if mtow_list[0] <= mtow <= mtow_list[-1]:
+            slope = (lod_list[j + 1] - lod_list[j]) / (mtow_list[j + 1] - mtow_list[j])
+        else:
+            slope = 0.
+        return slope * self.lod_factor * dmtow + np.interp(mtow, mtow_list, lod_list) * dlod_factor
+
+    def get_engine_eff_derivative(self, power_system, tas, max_power, dmax_power=0.):
+        """Overall efficiency of the power system and its derivative given the derivative of max_power
+        Only turboprop efficiency depends on max power
+        """
+        power_system = self.compile_power_system(power_system)
+        eff = power_system.engine_eff(tas, max_power)
+        if power_system.eff_model == self.turboprop:
+            a, b, c = power_system.psfc_coef
+            psfc_ref = unit.convert_from("kg/kW/h", a + b / unit.kW_W(max_power)**c)
+            dpsfc_ref = unit.convert_from("kg/kW/h", -c * b / unit.kW_W(max_power)**(c + 1.)) * unit.kW_W(dmax_power)
+            return eff, -eff * dpsfc_ref / psfc_ref
+        return eff, 0.
+
+    def total_fuel_derivative(self, tow, distance, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data,
+                              dtow=0., ddistance=0., dmtow=0., dtotal_power=0., dlod_factor=0.):
+        """Compute total fuel and energy of a mission like total_fuel() together with their derivatives
+        versus a parameter t, given the derivatives of the inputs versus t
+
+        :return: dictionary with keys "total_fuel", "d_total_fuel", "total_enrg", "d_total_enrg"
+        """
+        speed_type = self.get_speed_type(cruise_speed)
+
+        power_system = self.compile_power_system(power_system)
+        battery = power_system.is_battery
+        fhv = 1. if battery else power_system.fhv
+
+        max_power = total_power / power_system["engine_count"]
+        dmax_power = dtotal_power / power_system["engine_count"]
+
+        lod = self.get_lod(mtow)
+        dlod = self.get_lod_derivative(mtow, dmtow, dlod_factor)
+
+        def leg(start_mass, dstart_mass, altp, dist, ddist, time=None):
+            pamb, tamb, g = phd.atmosphere_g(altp, self.disa)
+            tas, mach = self.get_tas(tamb, cruise_speed, speed_type)
+            if time is not None:
+                dist, ddist = tas * time, 0.
+            eff, deff = self.get_engine_eff_derivative(power_system, tas, max_power, dmax_power)
+            x = g / (eff * fhv * lod)
+            dx = -x * (deff / eff + dlod / lod)
+            k, dk = x * dist, dx * dist + x * ddist
+            if battery:
+                return 0., 0., start_mass * k, dstart_mass * k + start_mass * dk      # Airplane mass is constant
+            fuel = start_mass * (1. - np.exp(-k))
+            dfuel = dstart_mass * (1. - np.exp(-k)) + start_mass * np.exp(-k) * dk
+            return fuel, dfuel, fuel * fhv, dfuel * fhv
+
+        cruise_altp = altitude_data["mission"]
+        mission_enrg = self.take_off_energy(total_power) + self.climb_energy(tow, cruise_altp)
+        dmission_enrg = self.take_off_energy(dtotal_power) + self.climb_energy(dtow, cruise_altp)
+        mission_fuel, dmission_fuel = 0., 0.
+        if not battery:
+            mission_fuel = mission_enrg * (self.fuel_energy_ratio / fhv)
+            dmission_fuel = dmission_enrg * (self.fuel_energy_ratio / fhv)
+
+        lf, dlf, le, dle = leg(tow, dtow, cruise_altp, distance, ddistance)
+        mission_fuel, dmission_fuel = mission_fuel + lf, dmission_fuel + dlf
+        mission_enrg, dmission_enrg = mission_enrg + le, dmission_enrg + dle
+
+        if not battery:
+            ldw, dldw = tow - mission_fuel, dtow - dmission_fuel
+        else:
+            ldw, dldw = tow, dtow
+
+        ff = reserve_data["fuel_factor"]
+        reserve = [ff * mission_fuel, ff * dmission_fuel, ff * mission_enrg, ff * dmission_enrg]
+        if reserve_data["diversion_leg"] > 0:
+            out = leg(ldw, dldw, altitude_data["diversion"], reserve_data["diversion_leg"], 0.)
+            reserve = [r + o for r, o in zip(reserve, out)]
+        if reserve_data["holding_time"] > 0:
+            out = leg(ldw, dldw, altitude_data["holding"], 0., 0., time=reserve_data["holding_time"])
+            reserve = [r + o for r, o in zip(reserve, out)]
+
+        return {"total_fuel": mission_fuel + reserve[0],
+                "d_total_fuel": dmission_fuel + reserve[1],
+                "total_enrg": mission_enrg + reserve[2],
+                "d_total_enrg": dmission_enrg + reserve[3]}
+
+    def owe_structure_derivative(self, npax, mtow, power_system, dmax_fuel=0., dmax_enrg=0.,
+                                 dmtow=0., ddistance=0., dtotal_power=0., dstdm_factor=0.):
+        """Derivative of the OWE computed by owe_structure() given the derivatives of its inputs
+        Propulsion and energy storage masses are linear versus power, fuel and energy, see PowerSystem
+        """
+        power_system = self.compile_power_system(power_system)
+
+        dbasic_mwe = self.standard_mass_derivative(mtow) * dmtow * self.stdm_factor + self.standard_mass(mtow) * dstdm_factor
+        dstd_mwe = dbasic_mwe + (power_system.propulsion_factor + power_system.fuel_cell_factor) * dtotal_power \
+                   + power_system.fuel_storage_factor * dmax_fuel + power_system.enrg_storage_factor * dmax_enrg
+        return dstd_mwe + self.op_item(npax, ddistance)
+
     #-------------------------------------------------------------------------------------------------------------------
     """Model components for airplane sizing, e.g. defining characteristics masses OWE, MZFW, MLW, MTOW
     """
@@ -979,7 +1379,6 @@ class GAM(object):
             npax = mission["npax"]
             payload = mission["payload"]
             mpax = payload / npax
-            self.mpax = mpax
         elif "npax" not in mission.keys() and "payload" in mission.keys():
             npax = 0
             mpax = self.get_pax_allowance(category)
@@ -988,6 +1387,7 @@ class GAM(object):
             raise Exception("Key 'npax' or/and key 'payload' must be present in mission input dictionary")
         return design_range, npax, mpax, payload, category, cruise_speed, cruise_altp
 
+    @cached_design(stage="sizing")
     def design_airplane(self, power_system, mission):
         """Perform the design of the aircraft with a target on Range
 
@@ -1012,8 +1412,7 @@ class GAM(object):
             The category is used to select the mode for fuel (energy) mission reserve computation
             The effect of cruise altitude will only impact the amount of fuel (energy) during mission climb
         """
-        if "bpr" not in power_system.keys():
-            power_system["bpr"] = None
+        power_system = self.compile_power_system(power_system)
 
         design_range, npax, mpax, payload, category, cruise_speed, cruise_altp = self.get_category_data(mission)
 
@@ -1022,17 +1421,24 @@ class GAM(object):
 
         def mass_mission_balance(mtow):
             total_power = self.ref_power(mtow)
-            dict_p = self.owe_performance(payload, mtow, design_range, cruise_speed, total_power, power_system, altitude_data, reserve_data)
-            dict_s = self.owe_structure(category, npax, mtow, design_range, total_power, dict_p["max_fuel"], dict_p["max_energy"], power_system)
-            mtow_out = dict_s["owe"] + payload + dict_p["total_fuel"]
-            return dict_p["owe"] - dict_s["owe"]
+            dtotal_power = self.ref_power_derivative(mtow)
+            # The fuel of the mission comes with its derivative, owe_performance() would compute it again
+            dict_d = self.total_fuel_derivative(mtow, design_range, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data,
+                                                dtow=1., dmtow=1., dtotal_power=dtotal_power)
+            owe_p = mtow - payload - dict_d["total_fuel"]
+            dict_s = self.owe_structure(category, npax, mtow, design_range, total_power,
+                                        dict_d["total_fuel"] * self.max_fuel_factor, dict_d["total_enrg"] * self.max_fuel_factor, power_system)
+            dowe_s = self.owe_structure_derivative(npax, mtow, power_system,
+                                                   dmax_fuel=dict_d["d_total_fuel"] * self.max_fuel_factor,
+                                                   dmax_enrg=dict_d["d_total_enrg"] * self.max_fuel_factor,
+                                                   dmtow=1., dtotal_power=dtotal_power)
+            return owe_p - dict_s["owe"], 1. - dict_d["d_total_fuel"] - dowe_s
 
         mtow_ini = 0.9e-3 * (payload / mpax) * design_range
-        output_dict = fsolve(mass_mission_balance, x0=mtow_ini, args=(), full_output=True)
-        if (output_dict[2] != 1) or output_dict[0][0] < 0:
+        mtow, info = usolver.newton_1d(mass_mission_balance, mtow_ini)
+        if not info["converged"] or mtow < 0:
             raise Exception("Convergence problem")
 
-        mtow = output_dict[0][0]
         total_power = self.ref_power(mtow)
         max_power = total_power / power_system["engine_count"]
         dict_p = self.owe_performance(payload, mtow, design_range, cruise_speed, total_power, power_system, altitude_data, reserve_data)
@@ -1051,16 +1457,17 @@ class GAM(object):
 
         wtc = self.wake_turbulence_class(mtow)
 
-        return self.design_dict(npax, mpax, design_range, cruise_speed, category, max_power, total_power, mtow, mzfw, mlw, payload_max,
-                            power_system, mission, altitude_data, reserve_data, dict_p, dict_s,
-                            storage_energy_density, propulsion_power_density, wtc)
+        ac_dict = self.design_dict(npax, mpax, design_range, cruise_speed, category, max_power, total_power, mtow, mzfw, mlw, payload_max,
+                                   power_system, mission, altitude_data, reserve_data, dict_p, dict_s,
+                                   storage_energy_density, propulsion_power_density, wtc)
+        ac_dict["solver_info"] = info
+        return ac_dict
 
     def best_design(self, power_system, mission, crit="pk_o_mass"):
         """Compute the optimal range for a given capacity according to the criterion PK/OWE or PK/E
         """
         def fct(range):
-            mission["range"] = range
-            this_dict = self.design_airplane(power_system, mission)
+            this_dict = self.design_airplane(power_system, {**mission, "range": range})
             return this_dict[crit]
 
         range_ini = unit.m_km(400)
@@ -1068,6 +1475,219 @@ class GAM(object):
         range_opt, pk_o_owe_max, rc = umath.maximize_1d(range_ini, dr, [fct])
         return range_opt, pk_o_owe_max, rc
 
+    #-------------------------------------------------------------------------------------------------------------------
+    """Batch design, many design missions for one power system solved together
+    """
+    def get_batch_data(self, missions):
+        """Retrieves payload, speed and altitude characteristics for a set of design missions
+        missions can be a dictionary of arrays or a DataFrame, see design_airplane_batch()
+        """
+        npax = np.atleast_1d(np.asarray(missions["npax"], dtype=float))
+        design_range = np.atleast_1d(np.asarray(missions["range"], dtype=float))
+        npax, design_range = np.broadcast_arrays(npax, design_range)
+        n = npax.size
+
+        if "category" in missions.keys():
+            category = np.broadcast_to(np.asarray(missions["category"], dtype=object), (n,)).copy()
+        else:
+            category = np.full(n, None, dtype=object)
+            for cat in reversed(list(self.category.keys())):
+                fit = (npax <= self.category[cat]["capacity"]) & (design_range <= self.category[cat]["distance"])
+                category[fit] = cat
+            if any(c is None for c in category):
+                raise Exception("Could not find category for some npax and range values")
+
+        def from_category(key, table):
+            if key in missions.keys():
+                return np.broadcast_to(np.asarray(missions[key], dtype=float), (n,)).copy()
+            return np.array([table(cat) for cat in category], dtype=float)
+
+        cruise_speed = from_category("speed", lambda cat: self.category[cat]["speed"])
+        cruise_altp = from_category("altitude", lambda cat: self.flight_altitudes[cat][0])
+        mpax = np.array([self.get_pax_allowance(cat) for cat in category], dtype=float)
+
+        if "payload" in missions.keys():
+            payload = np.broadcast_to(np.asarray(missions["payload"], dtype=float), (n,)).copy()
+            mpax = payload / npax
+        else:
+            payload = npax * mpax + self.delta_payload
+
+        return design_range, npax, mpax, payload, category, cruise_speed, cruise_altp
+
+    def batch_flight_data(self, category, cruise_altp):
+        """Flight altitudes and reserve parameters for a set of design missions, see flight_altitude() and reserve_data()
+        """
+        altitude_data = {"mission": cruise_altp,
+                         "diversion": np.array([self.flight_altitudes[cat][1] for cat in category], dtype=float),
+                         "holding": np.array([self.flight_altitudes[cat][2] for cat in category], dtype=float)}
+        reserve_data = {"fuel_factor": np.array([self.reserve_parameters[cat][0] for cat in category], dtype=float),
+                        "diversion_leg": np.array([self.reserve_parameters[cat][1] for cat in category], dtype=float),
+                        "holding_time": np.array([self.reserve_parameters[cat][2] for cat in category], dtype=float)}
+        return altitude_data, reserve_data
+
+    def batch_owe_structure(self, category, npax, mtow, distance, total_power, max_fuel, max_enrg, power_system):
+        """Array version of owe_structure()
+        """
+        furnishing = np.array([self.furnishing_dict[cat] for cat in category], dtype=float) * npax
+        operator_items = self.op_item(npax, distance)
+        standard_mass = self.standard_mass(mtow)
+        propulsion_mass, fuel_cell_system_mass = self.propulsion_mass(power_system, total_power)
+        energy_storage_mass, fuel_density = self.energy_storage_mass(power_system, max_fuel, max_enrg)
+
+        basic_mwe = standard_mass * self.stdm_factor + self.stdm_shift
+        std_mwe = basic_mwe + propulsion_mass + energy_storage_mass + fuel_cell_system_mass
+        mwe = std_mwe + furnishing
+        owe = mwe + operator_items
+
+        return {"owe": owe,
+                "op_item": operator_items,
+                "mwe": mwe,
+                "furnishing": furnishing,
+                "std_mwe": std_mwe,
+                "propulsion_mass": propulsion_mass * np.ones_like(mtow),
+                "fuel_cell_system_mass": fuel_cell_system_mass * np.ones_like(mtow),
+                "energy_storage_mass": energy_storage_mass * np.ones_like(mtow),
+                "fuel_density": fuel_density,
+                "basic_mwe": basic_mwe}
+
+    def design_airplane_batch(self, power_system, missions, xtol=1.e-10, maxiter=50):
+        """Perform the design of a set of aircraft sharing the same power system, with a target on Range
+
+        power_system : same dictionary as for design_airplane()
+
+        missions = {"npax": array, nominal number of passengers
+                    "range": array, m, design ranges
+                    "category": optional, string or array of strings, guessed from npax and range if missing
+                    "speed": optional, array, design cruise speed, can be speed in m/s or Mach number
+                    "altitude": optional, array, m, nominal cruise altitude
+                    "payload": optional, array, kg, replaces npax * pax allowance}
+
+        All the mass - mission balances are solved together with a vectorized secant method.
+        The method retrieves a DataFrame with one row per mission and one column per scalar entry of design_dict(),
+        plus the column "success" which is False when the balance could not be solved (other values are then NaN)
+
+        WARNINGS:
+            Any data to be given to methods MUST be delivered in standard units
+            Scalar values are broadcast over the missions
+        """
+        power_system = self.compile_power_system(power_system)
+
+        design_range, npax, mpax, payload, category, cruise_speed, cruise_altp = self.get_batch_data(missions)
+        altitude_data, reserve_data = self.batch_flight_data(category, cruise_altp)
+
+        def mass_mission_balance(mtow):
+            total_power = self.ref_power(mtow)
+            dict_p = self.total_fuel(mtow, design_range, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data)
+            owe_p = mtow - payload - dict_p["total_fuel"]
+            dict_s = self.batch_owe_structure(category, npax, mtow, design_range, total_power,
+                                              dict_p["total_fuel"] * self.max_fuel_factor,
+                                              dict_p["total_enrg"] * self.max_fuel_factor, power_system)
+            return owe_p - dict_s["owe"]
+
+        # Vectorized secant iterations, converged missions are frozen
+        x0 = 0.9e-3 * npax * design_range
+        x1 = 1.01 * x0
+        active = np.ones(x0.size, dtype=bool)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            y0 = mass_mission_balance(x0)
+            y1 = mass_mission_balance(x1)
+            for _ in range(maxiter):
+                dy = y1 - y0
+                step = np.where(dy != 0., y1 * (x1 - x0) / dy, 0.)
+                x2 = np.where(active, x1 - step, x1)
+                active = active & np.isfinite(x2) & (np.abs(x2 - x1) > xtol * np.abs(x2))
+                x0, y0 = x1, y1
+                x1 = x2
+                if not active.any():
+                    break
+                y1 = np.where(active, mass_mission_balance(x1), y1)
+
+        mtow = x1
+        with np.errstate(invalid="ignore"):
+            residual = np.abs(mass_mission_balance(mtow))
+            success = ~active & (0. < mtow) & (residual <= 1.e-6 * mtow)
+        mtow = np.where(success, mtow, np.nan)
+
+        total_power = self.ref_power(mtow)
+        max_power = total_power / power_system["engine_count"]
+        dict_p = self.total_fuel(mtow, design_range, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data)
+        max_fuel = dict_p["total_fuel"] * self.max_fuel_factor
+        max_enrg = dict_p["total_enrg"] * self.max_fuel_factor
+        dict_s = self.batch_owe_structure(category, npax, mtow, design_range, total_power, max_fuel, max_enrg, power_system)
+        owe = dict_s["owe"]
+
+        zero_dict = self.total_fuel(mtow, np.zeros_like(mtow), cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data)
+
+        payload_max = np.minimum(mtow - owe - zero_dict["total_fuel"], payload * self.max_payload_factor)
+        mzfw = owe + payload_max
+        mlw = mzfw * self.mlw_factor
+
+        storage_energy_density = dict_p["total_enrg"] / (dict_s["energy_storage_mass"] + dict_p["total_fuel"])
+        propulsion_power_density = total_power / (dict_s["propulsion_mass"] + dict_s["fuel_cell_system_mass"])
+
+        wtc = np.array(self.wt_class_list)[np.searchsorted(self.wtc_mtow_list, np.nan_to_num(mtow), side="right")]
+        pamb, tamb, g = phd.atmosphere_g(cruise_altp, self.disa)
+        tas, mach = self.get_tas(tamb, cruise_speed, None)
+
+        return pd.DataFrame({"success": success,
+                             "airplane_type": category,
+                             "npax": npax,
+                             "mpax": mpax,
+                             "delta_payload": self.delta_payload,
+                             "payload": payload,
+                             "max_payload_factor": self.max_payload_factor,
+
+                             "nominal_range": design_range,
+                             "cruise_speed": cruise_speed,
+                             "cruise_altitude": cruise_altp,
+                             "cruise_tas": tas,
+                             "nominal_time": design_range / tas,
+                             "mission_fuel": dict_p["mission_fuel"],
+                             "reserve_fuel": dict_p["reserve_fuel"],
+                             "total_fuel": dict_p["total_fuel"],
+                             "fuel_consumption": (dict_p["mission_fuel"] / dict_s["fuel_density"]) / npax / design_range,
+                             "mission_enrg": dict_p["mission_enrg"],
+                             "reserve_enrg": dict_p["reserve_enrg"],
+                             "total_energy": dict_p["total_enrg"],
+                             "enrg_consumption": dict_p["mission_enrg"] / npax / design_range,
+
+                             "n_engine": power_system["engine_count"],
+                             "by_pass_ratio": power_system["bpr"],
+                             "max_power": max_power,
+                             "total_power": total_power,
+                             "energy_type": power_system["energy_type"],
+                             "engine_type": power_system["engine_type"],
+                             "thruster_type": power_system["thruster_type"],
+
+                             "mtow": mtow,
+                             "mlw": mlw,
+                             "mzfw": mzfw,
+                             "payload_max": payload_max,
+                             "owe": owe,
+                             "op_item": dict_s["op_item"],
+                             "mwe": dict_s["mwe"],
+                             "furnishing": dict_s["furnishing"],
+                             "std_mwe": dict_s["std_mwe"],
+                             "propulsion_mass": dict_s["propulsion_mass"],
+                             "energy_storage_mass": dict_s["energy_storage_mass"],
+                             "fuel_cell_system_mass": dict_s["fuel_cell_system_mass"],
+                             "basic_mwe": dict_s["basic_mwe"],
+                             "stdm_factor": self.stdm_factor,
+                             "stdm_shift": self.stdm_shift,
+
+                             "storage_energy_density": storage_energy_density,
+                             "propulsion_power_density": propulsion_power_density,
+                             "aero_eff_factor": self.lod_factor,
+                             "aerodynamic_efficiency": dict_p["mission_lod"],
+                             "propulsion_system_efficiency": dict_p["global_eff"],
+                             "structural_factor": owe / mtow,
+
+                             "wake_turbulence_class": np.where(success, wtc, None),
+
+                             "pk_o_mass": npax * design_range / owe,
+                             "pk_o_enrg": npax * design_range / dict_p["total_enrg"]})
+
+    @cached_design(stage="sizing")
     def design_from_mtow(self, power_system, mission):
         """Perform the design with a target on MTOW instead of a target on Range
         Targetted MTOW must be provided in the mission dictionary under the keys "mtow"
@@ -1093,8 +1713,7 @@ class GAM(object):
             The category is used to select the mode for fuel (energy) mission reserve computation
             The effect of cruise altitude will only impact the amount of fuel (energy) during mission climb
         """
-        if "bpr" not in power_system.keys():
-            power_system["bpr"] = None
+        power_system = self.compile_power_system(power_system)
 
         design_range, npax, mpax, payload, category, cruise_speed, cruise_altp = self.get_category_data(mission)
 
@@ -1107,15 +1726,20 @@ class GAM(object):
         max_power = total_power / power_system["engine_count"]
 
         def mass_mission_balance(distance):
-            dict_p = self.owe_performance(payload, mtow, distance, cruise_speed, total_power, power_system, altitude_data, reserve_data)
-            dict_s = self.owe_structure(category, npax, mtow, distance, total_power, dict_p["max_fuel"], dict_p["max_energy"], power_system)
-            return dict_p["owe"] - dict_s["owe"]
+            dict_d = self.total_fuel_derivative(mtow, distance, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data,
+                                                ddistance=1.)
+            owe_p = mtow - payload - dict_d["total_fuel"]
+            dict_s = self.owe_structure(category, npax, mtow, distance, total_power,
+                                        dict_d["total_fuel"] * self.max_fuel_factor, dict_d["total_enrg"] * self.max_fuel_factor, power_system)
+            dowe_s = self.owe_structure_derivative(npax, mtow, power_system,
+                                                   dmax_fuel=dict_d["d_total_fuel"] * self.max_fuel_factor,
+                                                   dmax_enrg=dict_d["d_total_enrg"] * self.max_fuel_factor,
+                                                   ddistance=1.)
+            return owe_p - dict_s["owe"], - dict_d["d_total_fuel"] - dowe_s
 
         distance_ini = 40 * mtow
-        output_dict = fsolve(mass_mission_balance, x0=distance_ini, args=(), full_output=True)
-        if (output_dict[2] != 1): raise Exception("Convergence problem")
-
-        distance = output_dict[0][0]
+        distance, info = usolver.newton_1d(mass_mission_balance, distance_ini)
+        if not info["converged"]: raise Exception("Convergence problem")
 
         dict_p = self.owe_performance(payload, mtow, distance, cruise_speed, total_power, power_system, altitude_data, reserve_data)
         dict_s = self.owe_structure(category, npax, mtow, distance, total_power, dict_p["max_fuel"], dict_p["max_energy"], power_system)
@@ -1132,9 +1756,11 @@ class GAM(object):
 
         wtc = self.wake_turbulence_class(mtow)
 
-        return self.design_dict(npax, mpax, design_range, cruise_speed, category, max_power, total_power, mtow, mzfw, mlw, payload_max,
-                            power_system, mission, altitude_data, reserve_data, dict_p, dict_s,
-                            storage_energy_density, propulsion_power_density, wtc)
+        ac_dict = self.design_dict(npax, mpax, design_range, cruise_speed, category, max_power, total_power, mtow, mzfw, mlw, payload_max,
+                                   power_system, mission, altitude_data, reserve_data, dict_p, dict_s,
+                                   storage_energy_density, propulsion_power_density, wtc)
+        ac_dict["solver_info"] = info
+        return ac_dict
 
     def tune_design(self, power_system, mission):
         """Computes the following model parameters :
@@ -1176,9 +1802,9 @@ class GAM(object):
             "category", "range" and "speed" are compulsory
             The parameter : self.stdm_factor can be estimated from these data only for FUEL airplanes.
             For battery airplanes, it must be given by the user
+            Unlike the design methods, this method modifies the model, use self.snapshot() to keep the original one
         """
-        if "bpr" not in power_system.keys():
-            power_system["bpr"] = None
+        power_system = self.compile_power_system(power_system)
 
         design_range, npax, mpax, payload, category, cruise_speed, cruise_altp = self.get_category_data(mission)
 
@@ -1194,34 +1820,47 @@ class GAM(object):
         altitude_data = self.flight_altitude(category, cruise_altp)
         reserve_data = self.reserve_data(category)
 
+        def lod_factor_derivative(total_power):
+            # Derivatives of total fuel and of structural OWE versus lod_factor
+            dict_d = self.total_fuel_derivative(mtow_target, design_range, cruise_speed, mtow_target, total_power, power_system, altitude_data, reserve_data,
+                                                dlod_factor=1.)
+            dowe_s = self.owe_structure_derivative(npax, mtow_target, power_system,
+                                                   dmax_fuel=dict_d["d_total_fuel"] * self.max_fuel_factor,
+                                                   dmax_enrg=dict_d["d_total_enrg"] * self.max_fuel_factor)
+            return dict_d["d_total_fuel"], dowe_s
+
         def fct1(x):
             self.lod_factor = x[0]
             self.stdm_factor = x[1]
             total_power = self.ref_power(mtow_target)
             dict_p = self.owe_performance(payload, mtow_target, design_range, cruise_speed, total_power, power_system, altitude_data, reserve_data)
             dict_s = self.owe_structure(category, npax, mtow_target, design_range, total_power, dict_p["max_fuel"], dict_p["max_energy"], power_system)
-            return [owe_target - dict_p["owe"], owe_target - dict_s["owe"]]
+            dfuel, dowe_s = lod_factor_derivative(total_power)
+            jac = np.array([[dfuel, 0.],
+                            [-dowe_s, -self.standard_mass(mtow_target)]])
+            return np.array([owe_target - dict_p["owe"], owe_target - dict_s["owe"]]), jac
 
         def fct2(x):
             self.lod_factor = x
             total_power = self.ref_power(mtow_target)
             dict_p = self.owe_performance(payload, mtow_target, design_range, cruise_speed, total_power, power_system, altitude_data, reserve_data)
             dict_s = self.owe_structure(category, npax, mtow_target, design_range, total_power, dict_p["max_fuel"], dict_p["max_energy"], power_system)
-            return owe_target - dict_s["owe"]
+            dfuel, dowe_s = lod_factor_derivative(total_power)
+            return owe_target - dict_s["owe"], -dowe_s
 
         ac = self.design_from_mtow(power_system, mission)
 
-        if power_system["energy_type"] != self.battery:
+        if not power_system.is_battery:
             x_ini = [ac["aero_eff_factor"], ac["stdm_factor"]]
-            output_dict = fsolve(fct1, x0=x_ini, args=(), full_output=True)
-            if (output_dict[2] != 1): raise Exception("Convergence problem")
-            self.lod_factor = output_dict[0][0]
-            self.stdm_factor = output_dict[0][1]
+            x, info = usolver.newton_nd(fct1, x_ini)
+            if not info["converged"]: raise Exception("Convergence problem")
+            self.lod_factor = x[0]
+            self.stdm_factor = x[1]
         else:
             x_ini = ac["aero_eff_factor"]
-            output_dict = fsolve(fct2, x0=x_ini, args=(), full_output=True)
-            if (output_dict[2] != 1): raise Exception("Convergence problem")
-            self.lod_factor = output_dict[0][0]
+            x, info = usolver.newton_1d(fct2, x_ini)
+            if not info["converged"]: raise Exception("Convergence problem")
+            self.lod_factor = x
 
         total_power = self.ref_power(mtow_target)
         max_power = total_power / power_system["engine_count"]
@@ -1240,9 +1879,11 @@ class GAM(object):
 
         wtc = self.wake_turbulence_class(mtow_target)
 
-        return self.design_dict(npax, mpax, design_range, cruise_speed, category, max_power, total_power, mtow_target, mzfw, mlw, payload_max,
-                            power_system, mission, altitude_data, reserve_data, dict_p, dict_s,
-                            storage_energy_density, propulsion_power_density, wtc)
+        ac_dict = self.design_dict(npax, mpax, design_range, cruise_speed, category, max_power, total_power, mtow_target, mzfw, mlw, payload_max,
+                                   power_system, mission, altitude_data, reserve_data, dict_p, dict_s,
+                                   storage_energy_density, propulsion_power_density, wtc)
+        ac_dict["solver_info"] = info
+        return ac_dict
 
     def design_dict(self, npax, mpax, nominal_range, cruise_speed, category, max_power, total_power, mtow, mzfw, mlw, payload_max,
                     power_system, mission, altitude_data, reserve_data, dict_p, dict_s,
@@ -1260,7 +1901,7 @@ class GAM(object):
                 "mpax": mpax,
                 "delta_payload": self.delta_payload,
                 "payload": dict_p["payload"],
-                "mission": mission,
+                "mission": dict(mission),
                 "max_payload_factor" : self.max_payload_factor,
 
                 "nominal_range": nominal_range,
@@ -1282,7 +1923,7 @@ class GAM(object):
                 "by_pass_ratio": power_system["bpr"],
                 "max_power": max_power,
                 "total_power": total_power,
-                "power_system": power_system,
+                "power_system": dict(power_system),    # Plain dictionary, constants are compiled again when used
 
                 "mtow": mtow,
                 "mlw": mlw,
@@ -1312,59 +1953,82 @@ class GAM(object):
                 "pk_o_mass": npax * nominal_range / dict_s["owe"],
                 "pk_o_enrg": npax * nominal_range / dict_p["total_energy"]}
 
+    @cached_design(stage="sizing")
+    def cost_mission(self, ac_dict, cost_range):
+        """Technical stage of operating_cost(), fly the cost mission of an airplane and collect the physical data
+        the costs are computed from, the result only depends on the design and on the cost range
+        """
+        this_dict = self.fly_distance(ac_dict, cost_range, ac_dict["npax"], mode="pax")
+        max_power = ac_dict["max_power"]
+        return {"cost_range": cost_range,
+                "mission_enrg": this_dict["mission_enrg"],
+                "mission_time": this_dict["mission_time"],
+                "airframe_mass": ac_dict["basic_mwe"] + ac_dict["furnishing"] + ac_dict["op_item"],
+                "slst": max_power / (0.1 * ac_dict["cruise_tas"])}   # Assuming 10% of cruise speed is representative of a low speed reference
+
     def operating_cost(self, ac_dict, traffic_zone="west_bound"):
         """Estimate operating costs (coc & doc, from Thorbeck methodology)
+        The technical stage is done by cost_mission() and the economic stage by economic_cost()
         """
-        cd = self.cost_data
-        td = self.tech_data
+        mission = self.cost_mission(ac_dict, self.cost_range[ac_dict["airplane_type"]])
+        return self.economic_cost(ac_dict, mission, traffic_zone=traffic_zone)
+
+    def economic_cost(self, ac_dict, mission, traffic_zone="west_bound", cost_data=None, tech_data=None, energy_price=None):
+        """Economic stage of operating_cost(), apply prices, rates and fees to the result of cost_mission()
+        cost_data, tech_data and energy_price replace the model dictionaries when given, any of their values
+        can be an array of scenarios as well as traffic_zone can be a list of zones, all costs are then
+        retrieved as arrays (following numpy broadcasting rules)
+        No physics is solved here
+        """
+        cd = self.cost_data if cost_data is None else cost_data
+        td = self.tech_data if tech_data is None else tech_data
+        ep = self.energy_price if energy_price is None else energy_price
 
-        engine_type = ac_dict["power_system"]["engine_type"]
-        energy_type = ac_dict["power_system"]["energy_type"]
+        power_system = self.compile_power_system(ac_dict["power_system"])
+        energy_type = power_system["energy_type"]
+
+        if isinstance(traffic_zone, str):
+            zone_factor = self.traffic_zone_factor[traffic_zone]
+        else:
+            zone_factor = np.array([self.traffic_zone_factor[zone] for zone in traffic_zone])
 
         n_pax = ac_dict["npax"]
-        m_pax = self.get_pax_allowance(ac_dict["airplane_type"])
+        m_pax = ac_dict["mpax"]
 
-        # Fly cost mission
-        cost_range = self.cost_range[ac_dict["airplane_type"]]
-        this_dict = self.fly_distance(ac_dict, cost_range, n_pax, mode="pax")
-        mission_enrg = this_dict["mission_enrg"]
-        mission_time = this_dict["mission_time"]
+        cost_range = mission["cost_range"]
+        mission_enrg = mission["mission_enrg"]
+        mission_time = mission["mission_time"]
 
         mtow = ac_dict["mtow"]
         owe = ac_dict["owe"]
 
         n_engine = ac_dict["n_engine"]
-        max_power = ac_dict["max_power"]
-        cruise_tas = ac_dict["cruise_tas"]
 
         flight_cycle_count = self.yearly_utilization(mission_time)
 
-        m_airframe = ac_dict["basic_mwe"] + ac_dict["furnishing"] + ac_dict["op_item"]
-        airframe_price = cd["airframe_mass_price"] * m_airframe
+        airframe_price = cd["airframe_mass_price"] * mission["airframe_mass"]
 
         battery_yearly_capital_cost = 0
         fuel_cell_price = 0
         tank_price = 0
 
-        if engine_type == self.emotor:
+        if power_system.is_emotor:
             engine_price = td["emotor_power_price"] * ac_dict["max_power"] * n_engine
-            if energy_type in [self.gh2, self.lh2]:
+            if power_system.has_fuel_cell:
                 fuel_cell_price = td["fuel_cell_power_price"] * self.power_density[self.fuel_cell] * ac_dict["fuel_cell_system_mass"]
         else:
             engine_price = cd["thermal_engine_mass_price"] * ac_dict["propulsion_mass"]
 
-        if energy_type in [self.lh2, self.lch4, self.lnh3]:
-            tank_price = ac_dict["energy_storage_mass"] * td["lh2_tank_mass_price"]
-        elif energy_type == self.gh2:
-            tank_price = ac_dict["energy_storage_mass"] * td["gh2_tank_mass_price"]
-        elif energy_type == self.battery:
+        if power_system.tank_price_key is not None:
+            tank_price = ac_dict["energy_storage_mass"] * td[power_system.tank_price_key]
+        elif power_system.is_battery:
             battery_price = ac_dict["energy_storage_mass"] * self.battery_enrg_density * td["battery_capacity_price"]
             battery_depreciation_period = td["battery_lifetime_cycle"] / flight_cycle_count
             fac = (1 / (1 + cd["interest_rate"])) ** battery_depreciation_period
             battery_annuity_factor = cd["interest_rate"] * (1 - cd["residual_value_factor"] * fac) / (1 - fac)
             battery_yearly_capital_cost = battery_price * (battery_annuity_factor + cd["insurance_rate"])
 
-        slst = max_power / (0.1 * cruise_tas)   # Assuming 10% of cruise speed is representative of a low speed reference
+        slst = mission["slst"]
 
         fac = (1 / (1 + cd["interest_rate"])) ** cd["depreciation_period"]
         annuity_factor = cd["interest_rate"] * (1 - cd["residual_value_factor"] * fac) / (1 - fac)
@@ -1378,15 +2042,15 @@ class GAM(object):
         airframe_labor_cost = cd["labor_cost"] * (1 + cd["burden_factor"]) * ((0.655 + 0.01 * (owe / 1000)) * block_time_hour + 0.254 + 0.01 * (owe / 1000))
         engine_maintenance_cost = n_engine * (1.5 * unit.convert_to("kgf", slst) / 1000 + 30.5 * block_time_hour + 10.6)
 
-        if engine_type == self.emotor:
+        if power_system.is_emotor:
             engine_maintenance_cost = engine_maintenance_cost * td["emotor_maintenance_factor"]
 
         flight_maintenance_cost = airframe_material_cost + airframe_labor_cost + engine_maintenance_cost
 
-        yearly_flight_cost = (mission_enrg * self.energy_price[energy_type] +
+        yearly_flight_cost = (mission_enrg * ep[energy_type] +
                              m_pax * n_pax * cd["handling_fees"] +
                              mtow * cd["landing_fees"] +
-                             self.traffic_zone_factor[traffic_zone] * (cost_range / 1000) * np.sqrt(mtow / 50000) +
+                             zone_factor * (cost_range / 1000) * np.sqrt(mtow / 50000) +
                              flight_maintenance_cost) * flight_cycle_count
 
         yearly_cash_operating_cost = yearly_crew_cost + yearly_flight_cost
@@ -1531,7 +2195,7 @@ class GAM(object):
         mtow = ac_dict["mtow"]
         owe = ac_dict["owe"]
         total_power = ac_dict["total_power"]
-        power_system = ac_dict["power_system"]
+        power_system = self.compile_power_system(ac_dict["power_system"])
         reserve_data = ac_dict["reserve_data"]
 
         this_dict = self.total_fuel(tow, distance, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data)
@@ -1559,24 +2223,36 @@ class GAM(object):
         mtow = ac_dict["mtow"]
         owe = ac_dict["owe"]
         total_power = ac_dict["total_power"]
-        power_system = ac_dict["power_system"]
+        power_system = self.compile_power_system(ac_dict["power_system"])
         reserve_data = ac_dict["reserve_data"]
 
         def fct(distance):
             this_dict = self.total_fuel(tow, distance, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data)
-            if power_system["energy_type"] != self.battery:
+            dict_d = self.total_fuel_derivative(tow, distance, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data,
+                                                ddistance=1.)
+            if not power_system.is_battery:
                 y = tow - (owe + payload + this_dict["total_fuel"])
+                dy = - dict_d["d_total_fuel"]
             else:
                 y = ac_dict["total_energy"] - this_dict["total_enrg"]
-            return y
+                dy = - dict_d["d_total_enrg"]
+            return y, dy
 
-        dist_ini = 0.75 * ac_dict["nominal_range"]
-        output_dict = fsolve(fct, x0=dist_ini, args=(), full_output=True)
-        if (output_dict[2] != 1): raise Exception("Convergence problem")
+        law = self.mission_law(cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data)
+        if not power_system.is_battery:
+            distance = self.distance_from_tow(law, tow, tow - owe - payload)
+        else:
+            distance = self.distance_from_tow(law, tow, ac_dict["total_energy"])
 
-        distance = output_dict[0][0]
+        if distance is not None:
+            info = usolver.solver_info("closed_form", 0, 0, True)
+        else:
+            dist_ini = 0.75 * ac_dict["nominal_range"]
+            distance, info = usolver.newton_1d(fct, dist_ini)
+            if not info["converged"]: raise Exception("Convergence problem")
 
         this_dict = self.total_fuel(tow, distance, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data)
+        this_dict["solver_info"] = info
         this_dict["payload"] = payload
         this_dict["pk_o_mass"] = npax * distance / owe
         this_dict["pk_o_enrg"] = npax * distance / this_dict["total_enrg"]
@@ -1584,6 +2260,7 @@ class GAM(object):
 
     def fly_distance(self, ac_dict, distance, input, mode="pax"):
         """Compute a mission from distance & payload
+        distance and input can be arrays to fly a batch of missions at once, missions without solution then get NaN values
         """
         if mode == "pax":
             payload = input * ac_dict["mpax"]
@@ -1600,22 +2277,30 @@ class GAM(object):
         mtow = ac_dict["mtow"]
         owe = ac_dict["owe"]
         total_power = ac_dict["total_power"]
-        power_system = ac_dict["power_system"]
+        power_system = self.compile_power_system(ac_dict["power_system"])
         reserve_data = ac_dict["reserve_data"]
 
         def fct(tow):
             this_dict = self.total_fuel(tow, distance, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data)
-            return tow - (owe + payload + this_dict["total_fuel"])
-
-        if power_system["energy_type"] != self.battery:
-            tow_ini = 0.75 * mtow
-            output_dict = fsolve(fct, x0=tow_ini, args=(), full_output=True)
-            if (output_dict[2] != 1): raise Exception("Convergence problem")
-            tow = output_dict[0][0]
+            dict_d = self.total_fuel_derivative(tow, distance, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data,
+                                                dtow=1.)
+            return tow - (owe + payload + this_dict["total_fuel"]), 1. - dict_d["d_total_fuel"]
+
+        if not power_system.is_battery:
+            law = self.mission_law(cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data)
+            tow = self.tow_from_distance(law, distance, owe, payload)
+            if tow is not None:
+                info = usolver.solver_info("closed_form", 0, 0, True)
+            else:
+                tow_ini = 0.75 * mtow
+                tow, info = usolver.newton_1d(fct, tow_ini)
+                if not info["converged"]: raise Exception("Convergence problem")
         else:
             tow = owe + payload
+            info = usolver.solver_info("direct", 0, 0, True)
 
         this_dict = self.total_fuel(tow, distance, cruise_speed, mtow, total_power, power_system, altitude_data, reserve_data)
+        this_dict["solver_info"] = info
         this_dict["payload"] = payload
         this_dict["pk_o_mass"] = npax * distance / owe
         this_dict["pk_o_enrg"] = npax * distance / this_dict["total_enrg"]
@@ -1643,6 +2328,7 @@ class GAM(object):
     #-------------------------------------------------------------------------------------------------------------------
     """Methods to build and manage the Payload-Range diagram
     """
+    @cached_design(stage="sizing")
     def build_payload_range(self, ac_dict, mode="kg"):
         """Compute payload - range characteristics and add them to ac_dict
         mode = "mass" : payload will be retrieved in kg
@@ -1819,9 +2505,32 @@ class GAM(object):
         plt.tight_layout()
         plt.show()
 
+    def stack_payload_range(self, catalog):
+        """Stack the payload-range envelopes of a catalog of airplanes {name: ac_dict} into arrays
+        The result can be given in place of ac_dict to is_in_plr(), max_capacity() and max_distance(),
+        their results then get one last dimension indexed like catalog
+        WARNING : the payload-range of each airplane must be built first, see build_payload_range()
+        """
+        keys = ["payload_max", "payload_fuel_max", "range_pl_max", "range_fuel_max", "range_no_pl", "mpax"]
+        envelope = {key: np.array([catalog[ac][key] for ac in catalog.keys()], dtype=float) for key in keys}
+        envelope["names"] = list(catalog.keys())
+        return envelope
+
+    def plr_input(self, ac_dict, value):
+        """Array of value broadcastable against a payload-range envelope, see stack_payload_range()
+        """
+        value = np.asarray(value, dtype=float)
+        if "names" in ac_dict:
+            value = value[..., None]
+        return value
+
     def is_in_plr(self, ac_dict, distance, input, mode="pax"):
         """Detects if a mission is possible
+        distance and input can be arrays, ac_dict can be a stacked envelope, see stack_payload_range()
         """
+        distance = self.plr_input(ac_dict, distance)
+        input = self.plr_input(ac_dict, input)
+
         if mode == "pax":
             payload = input * ac_dict["mpax"]
         elif mode == "kg":
@@ -1829,8 +2538,6 @@ class GAM(object):
         else:
             raise Exception("input_type is unknown")
 
-        out_dict = {"capa": True, "dist": True}
-
         c1 = ac_dict["payload_max"] - payload  # Max payload limit
         c2 = (payload - ac_dict["payload_fuel_max"]) * (ac_dict["range_pl_max"] - ac_dict["range_fuel_max"]) \
              - (ac_dict["payload_max"] - ac_dict["payload_fuel_max"]) * (distance - ac_dict["range_fuel_max"])  # Max Take off weight limit
@@ -1838,50 +2545,55 @@ class GAM(object):
              - ac_dict["payload_max"] * (distance - ac_dict["range_no_pl"])  # Max fuel limit
         c4 = ac_dict["range_no_pl"] - distance  # Max range limit
 
-        if ((c1 < 0. or c2 < 0. or c3 < 0.) and c4 >= 0.):  # Out of PLR because of capacity
-            out_dict["capa"] = False
-        elif (c1 >= 0. and c4 < 0.):  # Out of PLR because of range
-            out_dict["dist"] = False
-        elif (c1 < 0. and c4 < 0.):  # Out of PLR because of range and capacity
-            out_dict["capa"] = False
-            out_dict["dist"] = False
-        return out_dict
+        out_capa = ((c1 < 0.) | (c2 < 0.) | (c3 < 0.)) & (c4 >= 0.)     # Out of PLR because of capacity
+        out_dist = (c1 >= 0.) & (c4 < 0.)                               # Out of PLR because of range
+        out_both = (c1 < 0.) & (c4 < 0.)                                # Out of PLR because of range and capacity
+
+        capa = ~(out_capa | out_both)
+        dist = ~(out_dist | out_both)
+        if np.ndim(capa) == 0:
+            return {"capa": bool(capa), "dist": bool(dist)}
+        return {"capa": capa, "dist": dist}
 
     def max_capacity(self, ac_dict, distance, mode="pax"):
         """Retrieve the maximum capacity for a given range
+        distance can be an array, ac_dict can be a stacked envelope, see stack_payload_range()
 
         :param ac_dict: Airplane dictionary
         :param distance: Distance to fly
         :return:  capacity
         """
-        if distance <= ac_dict["range_pl_max"]:
-            payload = ac_dict["payload_max"]
-            capacity = np.floor(ac_dict["payload_max"] / ac_dict["mpax"])
-        elif ac_dict["range_pl_max"] < distance and distance <= ac_dict["range_fuel_max"]:
-            payload = ac_dict["payload_fuel_max"] \
-                      + (ac_dict["payload_max"] - ac_dict["payload_fuel_max"]) * (distance - ac_dict["range_fuel_max"]) \
-                                                                               / (ac_dict["range_pl_max"] - ac_dict["range_fuel_max"])
-            capacity = np.floor(payload / ac_dict["mpax"])
-        elif ac_dict["range_fuel_max"] < distance and distance <= ac_dict["range_no_pl"]:
-            payload = ac_dict["payload_fuel_max"] * (distance - ac_dict["range_no_pl"]) \
-                                                  / (ac_dict["range_fuel_max"] - ac_dict["range_no_pl"])
-            capacity = np.floor(payload / ac_dict["mpax"])
-        else:
-            capacity = 0.
+        distance = self.plr_input(ac_dict, distance)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            payload = np.select([distance <= ac_dict["range_pl_max"],
+                                 distance <= ac_dict["range_fuel_max"],
+                                 distance <= ac_dict["range_no_pl"]],
+                                [ac_dict["payload_max"] + 0. * distance,
+                                 ac_dict["payload_fuel_max"]
+                                 + (ac_dict["payload_max"] - ac_dict["payload_fuel_max"]) * (distance - ac_dict["range_fuel_max"])
+                                                                                          / (ac_dict["range_pl_max"] - ac_dict["range_fuel_max"]),
+                                 ac_dict["payload_fuel_max"] * (distance - ac_dict["range_no_pl"])
+                                                             / (ac_dict["range_fuel_max"] - ac_dict["range_no_pl"])],
+                                default=0.)
+        capacity = np.floor(payload / ac_dict["mpax"])
         if mode == "pax":
-            return capacity
+            return capacity[()]
         elif mode == "kg":
-            return payload
+            return payload[()]
         else:
-            raise Exception["mode value is unknown"]
+            raise Exception("mode value is unknown")
 
     def max_distance(self, ac_dict, input, mode="pax"):
         """Retrieve the maximum range for a given number of passenger or payload mass
+        input can be an array, ac_dict can be a stacked envelope, see stack_payload_range()
 
         :param ac_dict: Airplane dictionary
         :param npax: Number of passenger
         :return:  distance
         """
+        input = self.plr_input(ac_dict, input)
+
         if mode == "pax":
             payload = input * ac_dict["mpax"]
         elif mode == "kg":
@@ -1889,38 +2601,26 @@ class GAM(object):
         else:
             raise Exception("input_type is unknown")
 
-        if ac_dict["payload_max"] < payload:
-            distance = 0.
-        elif ac_dict["payload_fuel_max"] < payload and payload <= ac_dict["payload_max"]:
-            distance = ac_dict["range_fuel_max"] + (payload - ac_dict["payload_fuel_max"]) * (
-                    ac_dict["range_pl_max"] - ac_dict["range_fuel_max"]) / (
-                               ac_dict["payload_max"] - ac_dict["payload_fuel_max"])
-        else:
-            distance = ac_dict["range_no_pl"] + payload * (ac_dict["range_fuel_max"] - ac_dict["range_no_pl"]) / \
-                       ac_dict["payload_fuel_max"]
-        return distance
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distance = np.select([ac_dict["payload_max"] < payload,
+                                  ac_dict["payload_fuel_max"] < payload],
+                                 [0. * payload,
+                                  ac_dict["range_fuel_max"] + (payload - ac_dict["payload_fuel_max"]) * (
+                                          ac_dict["range_pl_max"] - ac_dict["range_fuel_max"]) / (
+                                          ac_dict["payload_max"] - ac_dict["payload_fuel_max"])],
+                                 default=ac_dict["range_no_pl"] + payload * (ac_dict["range_fuel_max"] - ac_dict["range_no_pl"]) /
+                                         ac_dict["payload_fuel_max"])
+        return distance[()]
 
     #-------------------------------------------------------------------------------------------------------------------
     """Methods to manipulate the airplane data base
     """
+    @staticmethod
     def read_db(file):
-        """Read data base and convert to standard units
+        """Read data base and convert to standard units, the result is cached, see data_analysis.read_db()
         WARNING: special treatment for cruise_speed and max_speed which can be Mach number
         """
-        raw_data = pd.read_excel(file)  # Load data base as a Pandas data frame
-        un = raw_data.iloc[0:2, 0:]  # Take unit structure only
-        df = raw_data.iloc[2:, 0:].reset_index(drop=True)  # Remove unit rows and reset index
-
-        for name in df.columns:
-            if un.loc[0, name] not in ["string", "int"] and un.loc[1, name] != "mach":
-                df[name] = unit.convert_from(un.loc[0, name], list(df[name]))
-            if un.loc[0, name] == "string":
-                df[name] = [str(s) for s in list(df[name])]
-            if un.loc[1, name] == "mach":
-                for j in df.index:
-                    if df.loc[j, name] > 1.:
-                        df.loc[j, name] = float(unit.convert_from(un.loc[0, name], df.loc[j, name]))
-        return df, un
+        return uda.read_db(file)
 
     def clean_airplane_database(self, data_file):
         """Remove duplications from the Airplane Database
@@ -1937,24 +2637,25 @@ class GAM(object):
         """Get design data from data base given as dataframe df
         Can treat multiple request, lists are retrieved
         """
+        first = df.groupby(index, sort=False).indices     # Row positions of each index value, the first one is used
         power_system = []
         design_mission = []
         for ap in airplane:
-            df1 = df[df[index] == ap].reset_index(drop=True).copy()
-            if df1.shape[0] == 0:
+            if ap not in first:
                 raise Exception("Unknown index : ", index)
+            df1 = df.iloc[first[ap][0]]
 
-            power_system.append({"energy_type": df1["energy_type"].iloc[0],
-                                 "engine_count": df1["n_engine"].iloc[0],
-                                 "engine_type": df1["engine_type"].iloc[0],
-                                 "thruster_type": df1["thruster_type"].iloc[0],
-                                 "bpr": df1["bpr"].iloc[0]})
+            power_system.append({"energy_type": df1["energy_type"],
+                                 "engine_count": df1["n_engine"],
+                                 "engine_type": df1["engine_type"],
+                                 "thruster_type": df1["thruster_type"],
+                                 "bpr": df1["bpr"]})
 
-            design_mission.append({"category": df1["airplane_type"].iloc[0],
-                                   "npax": df1["n_pax"].iloc[0],
-                                   "speed": df1["cruise_speed"].iloc[0],
-                                   "range": df1["nominal_range"].iloc[0],
-                                   "altitude": df1["cruise_altitude"].iloc[0]})
+            design_mission.append({"category": df1["airplane_type"],
+                                   "npax": df1["n_pax"],
+                                   "speed": df1["cruise_speed"],
+                                   "range": df1["nominal_range"],
+                                   "altitude": df1["cruise_altitude"]})
 
         return power_system, design_mission
 
@@ -1984,9 +2685,16 @@ class GamNtwkPlugIn(object):
     # Seats
     # Loading           added (available seat per flight)
     # Time series
-    def __init__(self, gam_ac, airplane_code_file=None, airport_database_file=None, oag_file=None, capa_step=20, dist_step=unit.m_km(200)):
-
+    def __init__(self, gam_ac, airplane_code_file=None, airport_database_file=None, oag_file=None, capa_step=20, dist_step=unit.m_km(200),
+                 chunk_size=None, compact=False):
+        """If chunk_size is given, the OAG file is not loaded but read by chunks of chunk_size rows, see oag_chunks()
+        If compact is True, the schedule is stored with the memory compact schema of compact_oag() and oag_df_raw is not kept
+        """
         self.gam_ac = gam_ac
+        self.reuse_info = None
+        self.oag_file = oag_file
+        self.chunk_size = chunk_size
+        self.compact = compact
 
         if airplane_code_file is not None and airport_database_file is not None and oag_file is not None:
 
@@ -1997,35 +2705,42 @@ class GamNtwkPlugIn(object):
             self.airport_data['latitude'] = self.airport_data['latitude'].multiply(np.pi/180)       # Convert degrees into radians
             self.airport_data['longitude'] = self.airport_data['longitude'].multiply(np.pi/180)     # Convert degrees into radians
 
-            self.oag_df_raw = pd.read_csv(oag_file)
-
-            oag_df_in = self.oag_df_raw.copy()
-            oag_df_in['Distance'] = oag_df_in['Distance (KM)'].multiply(1000)
-            oag_df_in['Loading'] = oag_df_in['Seats']/oag_df_in['Frequency']
             apt_data = self.airport_data.copy()
             known_apt = set(apt_data["iata_code"])
             apt_data_orig = apt_data.rename(columns={'iata_code': 'Origin', 'country_id': 'Origin_country_id'})
             apt_data_dest = apt_data.rename(columns={'iata_code': 'Destination', 'country_id': 'Destination_country_id'})
-            apt_data_orig = apt_data_orig[['Origin', 'Origin_country_id']]
-            apt_data_dest = apt_data_dest[['Destination', 'Destination_country_id']]
+            self.apt_data_orig = apt_data_orig[['Origin', 'Origin_country_id']]
+            self.apt_data_dest = apt_data_dest[['Destination', 'Destination_country_id']]
 
-            oag_df_orig = pd.merge(oag_df_in, apt_data_orig, on=['Origin'])
-
-            self.oag_df = pd.merge(oag_df_orig, apt_data_dest, on=['Destination'])
+            ac_data = self.airplane_code.copy()
+            ap_code = ac_data[["iata_code", "model"]].drop_duplicates(subset=["iata_code"])
 
-            apt_fr_o = set(self.oag_df['Origin'])
-            apt_fr_d = set(self.oag_df['Destination'])
-            apt_fr = apt_fr_o.union(apt_fr_d)
+            # Integer indexed tables, the codes of the airport and equipment columns of a compact schedule are row numbers
+            self.airport_table = self.airport_data.drop_duplicates(subset=["iata_code"]).reset_index(drop=True)
+            self.aircraft_table = ap_code.reset_index(drop=True)
 
             self.info_dict = {}
 
-            self.info_dict["airport"] = list(apt_fr)
-            self.info_dict["unknown_airport"] = list(apt_fr - known_apt)
+            if chunk_size is None:
+                oag_df_raw = pd.read_csv(oag_file)
+                self.oag_df = self.enrich_oag(oag_df_raw)
+                if compact:
+                    before = self.oag_df.memory_usage(deep=True)
+                    self.oag_df = self.compact_oag(self.oag_df)
+                    self.info_dict["memory"] = self.memory_report(before, self.oag_df.memory_usage(deep=True))
+                    self.oag_df_raw = None
+                else:
+                    self.oag_df_raw = oag_df_raw
+                scan = self.scan_oag([self.oag_df], capa_step, dist_step)
+            else:
+                self.oag_df = None
+                scan = self.scan_oag(self.oag_chunks(), capa_step, dist_step)
+
+            self.info_dict["airport"] = list(scan["airport"])
+            self.info_dict["unknown_airport"] = list(scan["airport"] - known_apt)
 
-            ac_data = self.airplane_code.copy()
-            ap_code = ac_data[["iata_code", "model"]].drop_duplicates(subset=["iata_code"])
             ap_code.set_index("iata_code", inplace=True)
-            flying_set = set(self.oag_df["Equipment"])
+            flying_set = scan["aircraft"]
             known_set = set(ap_code.index)
 
             self.info_dict["aircraft"] = list(flying_set)
@@ -2033,17 +2748,107 @@ class GamNtwkPlugIn(object):
 
             self.info_dict["capa_step"] = capa_step
             self.info_dict["dist_step"] = dist_step
-            seats_list = np.arange(0, max(self.oag_df['Loading'])+1.01*capa_step, capa_step)
-            range_list = np.arange(0, max(self.oag_df['Distance'])+1.01*dist_step, dist_step)
-            bins_list = [seats_list, range_list]
-            data_flights = plt.hist2d(self.oag_df['Loading'], self.oag_df['Distance'],
-                                      weights = self.oag_df['Frequency'],
-                                      bins = bins_list)
-            # data_flights[0] : list of nc list of nr values
-            # data_flights[1] : list of capacities, nc values from 0 to max capacity
-            # data_flights[2] : list of ranges, nr values from 0 to max range
-            self.info_dict["flights"] = data_flights
-            plt.close()
+            # flights[0] : list of nc list of nr values
+            # flights[1] : list of capacities, nc values from 0 to max capacity
+            # flights[2] : list of ranges, nr values from 0 to max range
+            self.info_dict["flights"] = scan["flights"]
+
+    def enrich_oag(self, oag_df_in):
+        """Add Distance (m), Loading and the country ids of origin and destination to a piece of OAG schedule
+        Routes from or to an unknown airport are dropped
+        """
+        oag_df = oag_df_in.copy()
+        oag_df['Distance'] = oag_df['Distance (KM)'].multiply(1000)
+        oag_df['Loading'] = oag_df['Seats']/oag_df['Frequency']
+        oag_df = pd.merge(oag_df, self.apt_data_orig, on=['Origin'])
+        return pd.merge(oag_df, self.apt_data_dest, on=['Destination'])
+
+    def compact_oag(self, oag_df, rtol=1.e-6, max_category_ratio=0.5):
+        """Memory compact copy of a piece of enriched OAG schedule
+        Origin and Destination become categoricals whose codes are row numbers of self.airport_table, Equipment a
+        categorical whose codes below len(self.aircraft_table) are row numbers of this table, unknown equipments come after
+        Other text columns become categoricals if they have less than max_category_ratio distinct values per row
+        Integers are downcast to the smallest type holding them, floats to float32 if the relative rounding error stays below rtol
+        """
+        airport_dtype = pd.CategoricalDtype(self.airport_table["iata_code"])
+        country_dtype = pd.CategoricalDtype(self.airport_table["country_id"].dropna().unique())
+        known_equipment = list(self.aircraft_table["iata_code"])
+
+        compact = {}
+        for name in oag_df.columns:
+            column = oag_df[name]
+            if name in ["Origin", "Destination"]:
+                compact[name] = column.astype(airport_dtype)
+            elif name in ["Origin_country_id", "Destination_country_id"]:
+                compact[name] = column.astype(country_dtype)
+            elif name == "Equipment":
+                unknown = sorted(set(column.dropna()) - set(known_equipment), key=str)
+                compact[name] = column.astype(pd.CategoricalDtype(known_equipment + unknown))
+            elif column.dtype == object:
+                if column.nunique() < max_category_ratio * len(column):
+                    compact[name] = column.astype("category")
+                else:
+                    compact[name] = column
+            elif pd.api.types.is_integer_dtype(column):
+                compact[name] = pd.to_numeric(column, downcast="integer")
+            elif pd.api.types.is_float_dtype(column):
+                narrow = column.astype(np.float32)
+                if np.allclose(narrow, column, rtol=rtol, atol=0., equal_nan=True):
+                    compact[name] = narrow
+                else:
+                    compact[name] = column
+            else:
+                compact[name] = column
+        return pd.DataFrame(compact, index=oag_df.index)
+
+    def memory_report(self, before, after):
+        """Memory use per column in bytes before and after compaction, from DataFrame.memory_usage(deep=True)
+        """
+        table = pd.DataFrame({"before": before, "after": after})
+        return {"before": before.sum(), "after": after.sum(), "ratio": before.sum() / after.sum(), "columns": table}
+
+    def oag_chunks(self, chunk_size=None):
+        """Iterate over the enriched OAG schedule by pieces of chunk_size rows
+        Pieces are read from the OAG file when the plug-in was built with a chunk_size, they are sliced from self.oag_df otherwise
+        """
+        chunk_size = chunk_size or self.chunk_size
+        if self.oag_df is None:
+            for chunk in pd.read_csv(self.oag_file, chunksize=chunk_size):
+                if self.compact:
+                    yield self.compact_oag(self.enrich_oag(chunk))
+                else:
+                    yield self.enrich_oag(chunk)
+        elif chunk_size is None:
+            yield self.oag_df
+        else:
+            for k in range(0, len(self.oag_df), chunk_size):
+                yield self.oag_df.iloc[k:k+chunk_size]
+
+    def scan_oag(self, chunks, capa_step, dist_step):
+        """Accumulate the airport and aircraft sets and the capacity x distance flight grid over pieces of OAG schedule
+        The flight grid matches the one of plt.hist2d() with bins of capa_step seats and dist_step meters starting from 0
+        """
+        airport, aircraft = set(), set()
+        table = np.zeros((0, 0))
+        max_capa, max_dist = 0., 0.
+        for chunk in chunks:
+            airport.update(chunk["Origin"])
+            airport.update(chunk["Destination"])
+            aircraft.update(chunk["Equipment"])
+            if len(chunk) == 0:
+                continue
+            capa_bin = np.floor(chunk["Loading"].to_numpy(dtype=float) / capa_step).astype(int)
+            dist_bin = np.floor(chunk["Distance"].to_numpy(dtype=float) / dist_step).astype(int)
+            shape = (max(table.shape[0], capa_bin.max() + 1), max(table.shape[1], dist_bin.max() + 1))
+            table = np.pad(table, [(0, shape[0] - table.shape[0]), (0, shape[1] - table.shape[1])])
+            np.add.at(table, (capa_bin, dist_bin), chunk["Frequency"].to_numpy(dtype=float))
+            max_capa = max(max_capa, chunk["Loading"].max())
+            max_dist = max(max_dist, chunk["Distance"].max())
+
+        seats_list = np.arange(0, max_capa+1.01*capa_step, capa_step)
+        range_list = np.arange(0, max_dist+1.01*dist_step, dist_step)
+        table = np.pad(table, [(0, len(seats_list) - 1 - table.shape[0]), (0, len(range_list) - 1 - table.shape[1])])
+        return {"airport": airport, "aircraft": aircraft, "flights": (table, seats_list, range_list)}
 
     def get_data_base(self, file_name):
         df, un = uda.read_db(file_name)
@@ -2169,98 +2974,341 @@ class GamNtwkPlugIn(object):
     #-------------------------------------------------------------------------------------------------------------------
     """Methods to allocate airplane from a catalog on existing sets of routes
     """
+    def fly_missions(self, catalog, envelope, distance, n_pax, chunk_size=200000):
+        """Give each mission to the first airplane of the catalog able to fly it and compute its fuel per flight
+        envelope is the stacked payload-range of the catalog, see GAM.stack_payload_range()
+        Retrieves the index of the airplane in the catalog (-1 if the mission cannot be flown), the fuel per flight
+        (energy for battery airplanes, NaN if the mission cannot be flown) and the energy type of each mission
+        """
+        names = list(catalog.keys())
+
+        # First fit allocation, missions are processed by chunks to bound the size of the feasibility matrix
+        choice = np.full(len(distance), -1)
+        for k in range(0, len(distance), chunk_size):
+            out_dict = self.gam_ac.is_in_plr(envelope, distance[k:k+chunk_size], n_pax[k:k+chunk_size], mode="pax")
+            able = out_dict["capa"] & out_dict["dist"]
+            choice[k:k+chunk_size] = np.where(able.any(axis=1), able.argmax(axis=1), -1)
+
+        fuel = np.full(len(distance), np.nan)
+        energy_type = np.full(len(distance), None, dtype=object)
+        for j, ac in enumerate(names):
+            mask = choice == j
+            if mask.any():
+                this_dict = self.gam_ac.fly_distance(catalog[ac], distance[mask], n_pax[mask], mode="pax")
+                energy_type[mask] = catalog[ac]["power_system"]["energy_type"]
+                if catalog[ac]["power_system"]["energy_type"] == "battery":
+                    fuel[mask] = this_dict["mission_enrg"]
+                else:
+                    fuel[mask] = this_dict["mission_fuel"]
+
+        return choice, fuel, energy_type
+
+    def allocate_catalog(self, catalog, chunk_size=200000, oag_df=None):
+        """Columnar allocation of the airplanes of a catalog on the routes of oag_df, self.oag_df by default
+        Each route is given to the first airplane of the catalog able to fly it, feasibility is computed for all routes
+        against all airplanes at once and fuel with one batch of missions per airplane
+        Routes sharing the same loading and distance are allocated and flown once, the counts of routes and unique missions
+        are stored in self.reuse_info
+        Retrieves 4 DataFrames :
+            flights : allocated airplane (NaN if the route cannot be flown), energy type and fuel of each route
+                      fuel is given in kg, or in J of energy for battery airplanes
+            fleet : n_aircraft, n_flight, pk, mean_dist and speed of each airplane
+            airport : number of departures and arrivals per airport and airplane
+            fuel : total fuel or energy per energy type
+        """
+        flights, totals, airport, fuel = self.allocate_routes(catalog, chunk_size, oag_df)
+        return flights, self.fleet_table(catalog, totals), airport, fuel
+
+    def allocate_routes(self, catalog, chunk_size=200000, oag_df=None):
+        """Allocation of allocate_catalog() with fleet totals : n_flight, pk and mean_dist of each airplane
+        Totals of several pieces of schedule can be merged with merge_partials() and turned into a fleet with fleet_table()
+        """
+        if oag_df is None:
+            oag_df = self.oag_df
+
+        names = list(catalog.keys())
+        envelope = self.gam_ac.stack_payload_range(catalog)
+
+        n_pax = oag_df["Loading"].to_numpy(dtype=float)
+        distance = oag_df["Distance"].to_numpy(dtype=float)
+        n_flight = oag_df["Frequency"].to_numpy(dtype=float)
+
+        # Unique missions, route k flies mission inverse[k]
+        missions, inverse = np.unique(np.column_stack([distance, n_pax]), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        mission_dist, mission_pax = missions[:, 0], missions[:, 1]
+        self.reuse_info = {"routes": len(distance),
+                           "missions": len(missions),
+                           "reuse_ratio": len(distance) / max(1, len(missions))}
+
+        mission_choice, mission_fuel, mission_type = self.fly_missions(catalog, envelope, mission_dist, mission_pax, chunk_size)
+
+        choice = mission_choice[inverse]
+        energy_type = mission_type[inverse]
+        fuel = mission_fuel[inverse] * n_flight
+
+        flights = pd.DataFrame({"Origin": oag_df["Origin"].values,
+                                "Destination": oag_df["Destination"].values,
+                                "Distance": distance,
+                                "Loading": n_pax,
+                                "Frequency": n_flight,
+                                "Equipment_GAM": pd.Categorical.from_codes(choice, categories=names),
+                                "energy_type": energy_type,
+                                "fuel": fuel},
+                               index=oag_df.index)
+
+        flown = flights[choice >= 0].assign(pk=n_flight[choice >= 0] * n_pax[choice >= 0] * unit.km_m(distance[choice >= 0]),
+                                            flown_dist=n_flight[choice >= 0] * distance[choice >= 0])
+
+        totals = flown.groupby("Equipment_GAM", observed=True).agg(n_flight=("Frequency", "sum"),
+                                                                   pk=("pk", "sum"),
+                                                                   flown_dist=("flown_dist", "sum"))
+        totals.index = totals.index.astype(str)
+        totals["mean_dist"] = totals["flown_dist"] / totals["n_flight"]
+        totals = totals[["n_flight", "pk", "mean_dist"]]
+
+        departure = flown.groupby(["Origin", "Equipment_GAM"], observed=True)["Frequency"].sum()
+        arrival = flown.groupby(["Destination", "Equipment_GAM"], observed=True)["Frequency"].sum()
+        departure.index.names = ["airport", "airplane"]
+        arrival.index.names = ["airport", "airplane"]
+        airport = pd.concat({"Departure": departure, "Arrival": arrival}, axis=1).fillna(0.)
+
+        fuel = flown.groupby("energy_type")["fuel"].sum()
+
+        return flights, totals, airport, fuel
+
+    def fleet_table(self, catalog, totals):
+        """Fleet of allocate_catalog() from the n_flight, pk and mean_dist totals of each airplane
+        """
+        fleet = totals.loc[[ac for ac in catalog.keys() if ac in totals.index]].copy()
+        fleet["speed"] = self.gam_ac.true_air_speed([catalog[ac]["cruise_speed"] for ac in fleet.index],
+                                                    [catalog[ac]["altitude_data"]["mission"] for ac in fleet.index])
+        block_time = fleet["mean_dist"] / fleet["speed"]
+        fleet["n_aircraft"] = fleet["n_flight"] / self.gam_ac.yearly_utilization(block_time)
+        return fleet[["n_aircraft", "n_flight", "pk", "mean_dist", "speed"]]
+
+    def fly_binned(self, catalog, capa_step=None, dist_step=None, sample_size=2000, seed=0):
+        """Approximate network fuel, each non empty capacity x distance bin of the OAG schedule is flown once
+        at its frequency weighted centroid and its fuel per flight is multiplied by the total frequency of the bin
+        Bin steps default to the ones of the flight grid built by __init__, see info_dict["flights"]
+        The error is estimated on a random sample of sample_size routes flown exactly, no estimation if sample_size is 0
+        Retrieves 3 objects :
+            bins : capacity and distance indexes, centroid, frequency, route count, airplane and fuel of each bin
+            fuel : total fuel or energy per energy type
+            error : exact and binned fuel of the sample per energy type, relative error of the totals,
+                    largest relative error on a route and share of sample routes allocated to another airplane
+        """
+        if capa_step is None:
+            capa_step = getattr(self, "info_dict", {}).get("capa_step", 20)
+        if dist_step is None:
+            dist_step = getattr(self, "info_dict", {}).get("dist_step", unit.m_km(200))
+
+        names = list(catalog.keys())
+        envelope = self.gam_ac.stack_payload_range(catalog)
+
+        # Only three columns are kept when the OAG file is read by chunks
+        columns = ["Loading", "Distance", "Frequency"]
+        routes = np.concatenate([chunk[columns].to_numpy(dtype=float) for chunk in self.oag_chunks()] + [np.zeros((0, 3))])
+        n_pax, distance, n_flight = routes.T
+
+        # Bin k gathers the routes j such that inverse[j] = k
+        capa_bin = np.floor(n_pax / capa_step).astype(np.int64)
+        dist_bin = np.floor(distance / dist_step).astype(np.int64)
+        n_dist = dist_bin.max() + 1 if len(dist_bin) else 1
+        keys, inverse = np.unique(capa_bin * n_dist + dist_bin, return_inverse=True)
+        cells = np.column_stack([keys // n_dist, keys % n_dist])
+        frequency = np.bincount(inverse, weights=n_flight, minlength=len(cells))
+        weight = np.where(0 < frequency, frequency, 1.)
+        bin_pax = np.bincount(inverse, weights=n_flight * n_pax, minlength=len(cells)) / weight
+        bin_dist = np.bincount(inverse, weights=n_flight * distance, minlength=len(cells)) / weight
+
+        choice, bin_fuel, energy_type = self.fly_missions(catalog, envelope, bin_dist, bin_pax)
+
+        bins = pd.DataFrame({"capa_bin": cells[:, 0],
+                             "dist_bin": cells[:, 1],
+                             "Loading": bin_pax,
+                             "Distance": bin_dist,
+                             "Frequency": frequency,
+                             "routes": np.bincount(inverse, minlength=len(cells)),
+                             "Equipment_GAM": pd.Categorical.from_codes(choice, categories=names),
+                             "energy_type": energy_type,
+                             "fuel": bin_fuel * frequency})
+
+        fuel = bins[choice >= 0].groupby("energy_type")["fuel"].sum()
+
+        error = None
+        if 0 < sample_size:
+            rng = np.random.default_rng(seed)
+            sample = rng.choice(len(distance), size=min(sample_size, len(distance)), replace=False)
+            exact_choice, exact_fuel, exact_type = self.fly_missions(catalog, envelope, distance[sample], n_pax[sample])
+            exact_fuel = exact_fuel * n_flight[sample]
+            binned_fuel = bin_fuel[inverse[sample]] * n_flight[sample]
+            both = (exact_choice >= 0) & (choice[inverse[sample]] >= 0)
+            comparison = pd.DataFrame({"energy_type": exact_type[both],
+                                       "exact": exact_fuel[both],
+                                       "binned": binned_fuel[both]})
+            totals = comparison.groupby("energy_type")[["exact", "binned"]].sum()
+            totals["relative_error"] = (totals["binned"] - totals["exact"]) / totals["exact"]
+            route_error = np.abs(binned_fuel[both] - exact_fuel[both]) / exact_fuel[both]
+            error = {"sample": len(sample),
+                     "totals": totals,
+                     "max_route_error": route_error.max() if both.any() else np.nan,
+                     "allocation_mismatch": np.mean(exact_choice != choice[inverse[sample]])}
+
+        return bins, fuel, error
+
     def fly_catalog(self, catalog):
-        airport = {}
-        fleet = {}
-        fuel = {}
-        n_count = [0,0]
-        for r in range(len(self.oag_df.index)):  # Loop on routes
-            n_pax = self.oag_df.at[r, "Loading"]
-            distance = self.oag_df.at[r, "Distance"]
-            n_flight = self.oag_df.at[r, "Frequency"]
-            fly_able = False
-            for ac in catalog.keys():  # Loop on airplanes
-
-                out_dict = self.gam_ac.is_in_plr(catalog[ac], distance, n_pax, mode="pax")
-
-                if out_dict["capa"] and out_dict["dist"]:
-                    this_dict = self.gam_ac.fly_distance(catalog[ac], distance, n_pax)  # Compute consumption
-
-                    if catalog[ac]["power_system"]["energy_type"] in fuel.keys():
-                        if catalog[ac]["power_system"]["energy_type"] == "battery":
-                            fuel["battery"] += this_dict["mission_enrg"] * n_flight
-                        else:
-                            fuel[catalog[ac]["power_system"]["energy_type"]] += this_dict["mission_fuel"] * n_flight
-                    else:
-                        if catalog[ac]["power_system"]["energy_type"] == "battery":
-                            fuel["battery"] = this_dict["mission_enrg"] * n_flight
-                        else:
-                            fuel[catalog[ac]["power_system"]["energy_type"]] = this_dict["mission_fuel"] * n_flight
-
-                    fly_able = True
-                    self.oag_df.at[r, "Equipment_GAM"] = ac
-
-                    if ac in fleet.keys():
-                        fleet[ac]["mean_dist"] = (fleet[ac]["mean_dist"] * fleet[ac]["n_flight"] + distance * n_flight) / (fleet[ac]["n_flight"] + n_flight)
-                        fleet[ac]["pk"] += n_flight * n_pax * unit.km_m(distance)
-                        fleet[ac]["n_flight"] += n_flight
-                    else:
-                        if 1 < catalog[ac]["cruise_speed"]:
-                            speed = catalog[ac]["cruise_speed"]
-                        else:
-                            speed = phd.vtas_from_mach(catalog[ac]["altitude_data"]["mission"], 0, catalog[ac]["cruise_speed"])
-                        fleet[ac] = {"n_aircraft": 0,
-                                     "n_flight": n_flight,
-                                     "pk": n_flight * n_pax * unit.km_m(distance),
-                                     "mean_dist": distance,
-                                     "speed": speed}
-                    break
+        """Allocate the airplanes of a catalog on the routes of self.oag_df and retrieve airport, fleet and fuel dictionaries
+        See allocate_catalog() which does the job and retrieves DataFrames
+        fly_catalog_chunks() is used when the OAG file is read by chunks, allocated airplanes of the routes are then not kept
+        """
+        if self.oag_df is None:
+            return self.fly_catalog_chunks(catalog)
 
-            if not fly_able:
-                print("Route n° ", r, " cannot be flown, n_pax = ", n_pax, "  dist = ", "%.0f" % unit.km_m(distance), " km")
+        flights, fleet, airport_df, fuel = self.allocate_catalog(catalog)
 
-            orig = self.oag_df.at[r, "Origin"]
-            if orig in airport.keys():
-                if "Departure" in airport[orig]:
-                    if ac in airport[orig]["Departure"].keys():
-                        airport[orig]["Departure"][ac] += n_flight
-                    else:
-                        airport[orig]["Departure"][ac] = n_flight
-                else:
-                    airport[orig]["Departure"] = {ac: n_flight}
-            else:
-                airport[orig] = {"Departure": {ac: n_flight}}
-
-            dest = self.oag_df.at[r, "Destination"]
-            if dest in airport.keys():
-                if "Arrival" in airport[dest]:
-                    if ac in airport[dest]["Arrival"].keys():
-                        airport[dest]["Arrival"][ac] += n_flight
-                    else:
-                        airport[dest]["Arrival"][ac] = n_flight
-                else:
-                    airport[dest] = {"Arrival": {ac: n_flight}}
-            else:
-                airport[dest] = {"Arrival": {ac: n_flight}}
+        print("Routes : ", self.reuse_info["routes"], "  unique missions : ", self.reuse_info["missions"],
+              "  reuse ratio : ", "%.1f" % self.reuse_info["reuse_ratio"])
 
-            n_count[0] += 1
-            n_count[1] += 1
-            if 100000 <= n_count[0]:
-                print("")
-                print(n_count[1])
-                n_count[0] = 0
+        self.oag_df["Equipment_GAM"] = flights["Equipment_GAM"]
 
-        print("")
-        print(n_count[1])
+        for r in np.flatnonzero(flights["Equipment_GAM"].isna().to_numpy()):
+            print("Route n° ", r, " cannot be flown, n_pax = ", flights["Loading"].iloc[r], "  dist = ", "%.0f" % unit.km_m(flights["Distance"].iloc[r]), " km")
+
+        return self.airport_dict(airport_df), fleet.to_dict(orient="index"), fuel.to_dict()
+
+    def fly_catalog_chunks(self, catalog, chunk_size=None):
+        """Chunk wise fly_catalog(), routes are read and allocated by pieces of chunk_size rows, see oag_chunks()
+        Fleet, airport and fuel aggregates are accumulated over the pieces, allocated airplanes of the routes are not kept
+        Memory use only depends on chunk_size, so schedules larger than memory can be processed
+        """
+        partial = self.merge_partials([])
+        for chunk in self.oag_chunks(chunk_size):
+            partial = self.merge_partials([partial, self.fly_partial(catalog, chunk)])
+        return self.partial_result(catalog, partial)
+
+    #-------------------------------------------------------------------------------------------------------------------
+    """Methods to split network runs into shards and merge their partial results
+    """
+    def fly_partial(self, catalog, oag_df=None):
+        """Partial result of the allocation of a catalog on the routes of oag_df, self.oag_df by default
+        Partial results of disjoint pieces of schedule are merged with merge_partials()
+        """
+        flights, totals, airport, fuel = self.allocate_routes(catalog, oag_df=oag_df)
+        return {"fleet": totals,
+                "airport": airport,
+                "fuel": fuel,
+                "routes": self.reuse_info["routes"],
+                "missions": self.reuse_info["missions"],
+                "unflown": int(flights["Equipment_GAM"].isna().sum())}
+
+    def merge_partials(self, partials):
+        """Merge partial results, see fly_partial(), the merge is associative and the empty list gives a neutral element
+        n_flight, pk, airport movements, fuel and counts are summed, mean_dist is averaged with n_flight weights
+        """
+        partials = list(partials)
+        fleet = pd.concat([p["fleet"] for p in partials] + [pd.DataFrame(columns=["n_flight", "pk", "mean_dist"], dtype=float)])
+        fleet = fleet.assign(flown_dist=fleet["mean_dist"] * fleet["n_flight"]).groupby(level=0, sort=False).sum()
+        fleet["mean_dist"] = fleet["flown_dist"] / fleet["n_flight"]
+
+        airport = [p["airport"] for p in partials if 0 < len(p["airport"])]
+        if 0 < len(airport):
+            airport = pd.concat(airport).groupby(level=[0, 1], sort=False, observed=True).sum()
+        else:
+            airport = pd.DataFrame(columns=["Departure", "Arrival"], dtype=float)
+
+        fuel = pd.concat([p["fuel"] for p in partials] + [pd.Series(dtype=float)])
 
-        for ac in fleet.keys():
-            block_time = fleet[ac]["mean_dist"] / fleet[ac]["speed"]
-            yearly_flights = self.gam_ac.yearly_utilization(block_time)
-            fleet[ac]["n_aircraft"] = fleet[ac]["n_flight"] / yearly_flights
+        return {"fleet": fleet[["n_flight", "pk", "mean_dist"]],
+                "airport": airport,
+                "fuel": fuel.groupby(level=0, sort=False).sum(),
+                "routes": sum(p["routes"] for p in partials),
+                "missions": sum(p["missions"] for p in partials),
+                "unflown": sum(p["unflown"] for p in partials)}
 
-        return airport, fleet, fuel
+    def partial_result(self, catalog, partial):
+        """Airport, fleet and fuel dictionaries of fly_catalog() from a merged partial result
+        """
+        self.reuse_info = {"routes": partial["routes"],
+                           "missions": partial["missions"],
+                           "reuse_ratio": partial["routes"] / max(1, partial["missions"])}
+        print("Routes : ", partial["routes"], "  missions : ", partial["missions"], "  routes that cannot be flown : ", partial["unflown"])
+
+        fleet = self.fleet_table(catalog, partial["fleet"])
+        return self.airport_dict(partial["airport"]), fleet.to_dict(orient="index"), partial["fuel"].to_dict()
+
+    def oag_shards(self, n_shards=1, by=None):
+        """Split self.oag_df into shards, by row ranges into n_shards pieces or by the values of the column named by,
+        "Origin_country_id" for instance
+        When the OAG file is read by chunks, shards are the pieces of chunk_size rows of oag_chunks() whatever n_shards,
+        they are read one at a time
+        """
+        if self.oag_df is None:
+            if by is not None:
+                raise Exception("Shards by column are not available when the OAG file is read by chunks, build the plug-in without chunk_size")
+            return self.oag_chunks()
+        if by is None:
+            size = -(-len(self.oag_df) // max(1, n_shards))
+            return [self.oag_df.iloc[k:k+size] for k in range(0, len(self.oag_df), max(1, size))]
+        return [shard for key, shard in self.oag_df.groupby(by, sort=False, observed=True)]
+
+    def write_shards(self, directory, n_shards=1, by=None):
+        """Write the shards of oag_shards() into pickle files of directory and retrieve the file names
+        Each file can be processed by an independent job with fly_shard_file()
+        """
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for j, shard in enumerate(self.oag_shards(n_shards, by)):
+            files.append(os.path.join(directory, "shard_%05d.pkl" % j))
+            shard.to_pickle(files[-1])
+        return files
+
+    def fly_shard_file(self, catalog, shard_file, partial_file=None):
+        """Compute the partial result of a shard file written by write_shards(), and write it into partial_file if given
+        Partial files are merged with merge_partials([pd.read_pickle(file) for file in partial_files])
+        """
+        partial = self.fly_partial(catalog, pd.read_pickle(shard_file))
+        if partial_file is not None:
+            pd.to_pickle(partial, partial_file)
+        return partial
+
+    def fly_catalog_sharded(self, catalog, shards=None, n_shards=None, by=None, executor=None, workers=None):
+        """Sharded fly_catalog(), shards of the schedule are flown independently and their partial results are merged
+        Shards are taken from oag_shards() if not given, one per worker by default
+        Shards are spread over the executor if one is given, over a process pool of the given number of workers otherwise,
+        serial evaluation is done if both are None, allocated airplanes of the routes are not kept
+        """
+        if shards is None:
+            shards = self.oag_shards(n_shards or workers or 1, by)
 
+        if executor is None and workers is not None and workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                return self.fly_catalog_sharded(catalog, shards, executor=pool)
 
+        if executor is None:
+            partials = [fly_shard(self.gam_ac, catalog, shard) for shard in shards]
+        else:
+            partials = list(executor.map(fly_shard, repeat(self.gam_ac), repeat(catalog), shards))
+
+        return self.partial_result(catalog, self.merge_partials(partials))
+
+    def airport_dict(self, airport_df):
+        """Nested dictionary {airport: {direction: {airplane: frequency}}} of the airport DataFrame of allocate_catalog()
+        """
+        airport = {}
+        for (apt, ac), row in airport_df.iterrows():
+            for direction in ["Departure", "Arrival"]:
+                if 0 < row[direction]:
+                    airport.setdefault(apt, {}).setdefault(direction, {})[ac] = row[direction]
+        return airport
+
+
+
+def fly_shard(gam_ac, catalog, shard):
+    """Partial result of a shard of schedule, runs in worker processes, see GamNtwkPlugIn.fly_catalog_sharded()
+    """
+    ntwk = GamNtwkPlugIn(gam_ac)
+    return ntwk.fly_partial(catalog, shard)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A memoizing cache for the design methods of the GAM
+
+Results are keyed on a canonical form of the arguments and of the model parameters of the GAM instance the method
+depends on, so any change of one of these parameters, even in place inside a dictionary, leads to a new key.
+Failing evaluations are cached as well, their exception is raised again on cache hits.
+
+:author: Conceptual Airplane Design & Operations (CADO team)
+         Aircraft & Systems, Air Transport Department, ENAC
+"""
+
+import functools
+import hashlib
+import inspect
+import pickle
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from copy import copy, deepcopy
+
+import numpy as np
+import pandas as pd
+
+
+def canonical(obj):
+    """Hashable and order independent image of obj made of tuples, strings and numbers
+    """
+    if isinstance(obj, (str, bytes, int, float, bool, type(None), np.number, np.bool_)):
+        return obj
+    if isinstance(obj, Mapping):
+        items = [(str(k), canonical(v)) for k, v in obj.items()]
+        return ("map", tuple(sorted(items, key=lambda kv: kv[0])), canonical(getattr(obj, "__dict__", None)))
+    if isinstance(obj, (list, tuple)):
+        return ("seq", tuple(canonical(v) for v in obj))
+    if isinstance(obj, (set, frozenset)):
+        return ("set", tuple(sorted(repr(canonical(v)) for v in obj)))
+    if isinstance(obj, np.ndarray):
+        return ("array", obj.shape, str(obj.dtype), obj.tobytes())
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return ("pandas", tuple(pd.util.hash_pandas_object(obj, index=True)))
+    if hasattr(obj, "__dict__"):
+        return (type(obj).__name__, canonical(vars(obj)))
+    return repr(obj)
+
+
+def fingerprint(obj):
+    """Short digest of obj, much faster than canonical() for large objects
+    It depends on the insertion order of dictionaries, two equal objects built in different orders may then have
+    different fingerprints, which only costs a cache miss
+    """
+    try:
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        data = repr(canonical(obj)).encode()
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+@functools.lru_cache(maxsize=None)
+def signature(method):
+    return inspect.signature(method)
+
+
+def bind_arguments(method, owner, args, kwargs):
+    """Arguments of method(owner, *args, **kwargs) per parameter name, defaults included and owner excluded
+    """
+    bound = signature(method).bind(owner, *args, **kwargs)
+    bound.apply_defaults()
+    arguments = bound.arguments
+    del arguments[next(iter(arguments))]
+    return arguments
+
+
+class DesignCache(object):
+    """Size bounded LRU cache of GAM results with hit and miss statistics
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        # Copies of a GAM instance keep on sharing its cache, entries are keyed on the model parameters anyway
+        return self
+
+    def __reduce__(self):
+        # The lock cannot be pickled, an empty cache of the same size is rebuilt
+        return (DesignCache, (self.maxsize,))
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.maxsize}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def key(self, owner, method, args, kwargs, stage=None):
+        """Cache key of method(owner, *args, **kwargs)
+        Arguments are bound to the parameters of the method, so positional and keyword calls share their key
+        stage restricts the model parameters to the ones the method depends on, see GAM.model_fingerprint()
+        """
+        arguments = bind_arguments(method, owner, args, kwargs)
+        if stage is None:
+            fingerprint = owner.model_fingerprint()
+        else:
+            fingerprint = owner.model_fingerprint(stage, next(iter(arguments.values()), None))
+        return (method.__name__, canonical(arguments), fingerprint)
+
+    def get(self, key):
+        """Return the entry stored under key, None if there is none
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def lookup(self, owner, name, args, kwargs=None):
+        """Return (True, result) if the result of owner.name(*args, **kwargs) is in the cache, (False, None) otherwise
+        Side effects of the method are not replayed, the exception of a failing evaluation is raised again
+        """
+        wrapper = getattr(type(owner), name)
+        entry = self.get(self.key(owner, wrapper.__wrapped__, args, kwargs or {}, wrapper.stage))
+        if entry is None:
+            return False, None
+        result, arg_updates, attr_updates, error = entry
+        if error is not None:
+            raise copy(error)
+        return True, deepcopy(result)
+
+    def store(self, owner, name, args, kwargs, result):
+        """Store the result of owner.name(*args, **kwargs) computed elsewhere, in a worker process for instance
+        An exception instance given as result stands for a failing evaluation
+        """
+        wrapper = getattr(type(owner), name)
+        key = self.key(owner, wrapper.__wrapped__, args, kwargs, wrapper.stage)
+        if isinstance(result, Exception):
+            self.put(key, (None, [], {}, copy(result)))
+        else:
+            self.put(key, (deepcopy(result), [], {}, None))
+
+    def call(self, owner, method, args, kwargs, stage=None):
+        """Return method(owner, *args, **kwargs) from the cache or compute and store it
+        Top level keys written by the method into its dictionary arguments and attributes of owner
+        reassigned by the method are recorded and replayed on cache hits
+        """
+        key = self.key(owner, method, args, kwargs, stage)
+        arguments = bind_arguments(method, owner, args, kwargs)
+
+        entry = self.get(key)
+        if entry is not None:
+            result, arg_updates, attr_updates, error = entry
+            if error is not None:
+                raise copy(error)
+            for name, update in arg_updates:
+                arguments[name].update(deepcopy(update))
+            for name, value in attr_updates.items():
+                setattr(owner, name, deepcopy(value))
+            return deepcopy(result)
+
+        attrs_before = dict(vars(owner))
+        args_before = [(name, dict(a)) for name, a in arguments.items() if isinstance(a, dict)]
+
+        try:
+            result = method(owner, *args, **kwargs)
+        except Exception as error:
+            with self.lock:
+                self.misses += 1
+            self.put(key, (None, [], {}, copy(error)))      # The copy does not hold the traceback and its frames
+            raise
+
+        arg_updates = []
+        for name, before in args_before:
+            update = {k: v for k, v in arguments[name].items() if k not in before or before[k] is not v}
+            if update:
+                arg_updates.append((name, deepcopy(update)))
+        attr_updates = {k: deepcopy(v) for k, v in vars(owner).items()
+                        if (k not in attrs_before or attrs_before[k] is not v) and k != "design_cache"}
+
+        with self.lock:
+            self.misses += 1
+        self.put(key, (deepcopy(result), arg_updates, attr_updates, None))
+        return result
+
+
+def cached_design(method=None, stage=None):
+    """Route a GAM method through its design cache when one is enabled, see GAM.enable_design_cache()
+    stage names the model parameters the method depends on, all of them are used if it is None
+    """
+    if method is None:
+        return functools.partial(cached_design, stage=stage)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.design_cache is None:
+            return method(self, *args, **kwargs)
+        return self.design_cache.call(self, method, args, kwargs, stage)
+    wrapper.stage = stage
+    return wrapper
+
+
+shared_design_cache = DesignCache(maxsize=4096)     # Process wide cache, can be shared by several GAM instances
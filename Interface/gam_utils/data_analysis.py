@@ -13,6 +13,9 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.colors as plt_colors
 
+import glob
+import hashlib
+import os
 import pickle
 
 from gam_utils import unit
@@ -97,26 +100,112 @@ def load_data_from_file(file_name):
     return data
 
 
-def read_db(file):
+DB_CACHE_VERSION = 2    # To be incremented when parse_db() changes, so that cached data bases are parsed again
+
+
+def file_fingerprint(file):
+    """Absolute path, size and modification time of a file, data cached from the file are keyed on it
+    """
+    stat = os.stat(file)
+    return os.path.abspath(file), stat.st_size, stat.st_mtime_ns
+
+
+def cache_path(file, tag, cache_dir=None):
+    """Name of the cache file of the tag content of a source file, without extension
+    The name depends on the fingerprint of the source file, see file_fingerprint(), and on DB_CACHE_VERSION
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(file)), ".db_cache")
+    source = "%s|%d|%d|%s|%d" % (*file_fingerprint(file), tag, DB_CACHE_VERSION)
+    digest = hashlib.blake2b(source.encode(), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, "%s.%s.%s" % (os.path.basename(file), tag, digest))
+
+
+def cached_frame(file, tag, build, cache_dir=None):
+    """Return the DataFrame build() computed from a source file, served from a columnar cache while the file is unchanged
+    Frames are stored in Parquet, or pickled if pyarrow is missing or if they hold columns of mixed types
+    Frames read from the cache are returned on misses as well, so hits and misses return the same thing
+    """
+    if not isinstance(file, (str, os.PathLike)):
+        return build()      # Uploaded files or buffers are not cached
+
+    path = cache_path(file, tag, cache_dir)
+    for ext, reader in [(".parquet", pd.read_parquet), (".pkl", pd.read_pickle)]:
+        if os.path.exists(path + ext):
+            try:
+                return reader(path + ext)
+            except Exception:
+                pass        # Unreadable cache file, it is rebuilt
+
+    frame = build()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for old in glob.glob(glob.escape(path.rsplit(".", 1)[0]) + ".*"):
+        os.remove(old)      # Entries of previous versions of the source file
+    try:
+        frame.to_parquet(path + ".parquet")
+        return pd.read_parquet(path + ".parquet")
+    except Exception:
+        if os.path.exists(path + ".parquet"):
+            os.remove(path + ".parquet")
+        frame.to_pickle(path + ".pkl")
+        return frame
+
+
+def read_excel(file, cache_dir=None):
+    """Cached pd.read_excel(file), see cached_frame()
+    """
+    return cached_frame(file, "raw", lambda: pd.read_excel(file), cache_dir)
+
+
+def read_db(file, cache_dir=None, split_speed=False):
     """Read data base and convert to standard units
+    Converted data and units are cached, see cached_frame(), see parse_db() for split_speed
+    """
+    tag = "split" if split_speed else ""
+    parsed = []
+    def parse(k):
+        if not parsed:
+            parsed.extend(parse_db(read_excel(file, cache_dir), split_speed))
+        return parsed[k]
+    df = cached_frame(file, "db" + tag, lambda: parse(0), cache_dir)
+    un = cached_frame(file, "units" + tag, lambda: parse(1), cache_dir)
+    return df, un
+
+
+def parse_db(raw_data, split_speed=False):
+    """Convert a data base read from Excel to standard units
     WARNING: special treatment for cruise_speed and max_speed which can be Mach number
+    If split_speed is True, each of these columns is also split into explicit Mach and true air speed columns,
+    cruise_mach and cruise_tas for cruise_speed for instance, see split_speed_column()
     """
-    raw_data = pd.read_excel(file)     # Load data base as a Pandas data frame
     un = raw_data.iloc[0:2,0:]                          # Take unit structure only
     df = raw_data.iloc[2:,0:].reset_index(drop=True)    # Remove unit rows and reset index
 
+    umap = {name: un.loc[0,name] for name in df.columns if un.loc[0,name] not in ["string","int"] and un.loc[1,name] != "mach"}
+    df = unit.convert_columns_from(umap, df)
+
     for name in df.columns:
-        if un.loc[0,name] not in ["string","int"] and un.loc[1,name] != "mach":
-            df[name] = unit.convert_from(un.loc[0,name], list(df[name]))
         if un.loc[0,name]=="string":
             df[name] = [str(s) for s in list(df[name])]
         if un.loc[1,name] == "mach":
-            for j in df.index:
-                if df.loc[j, name] > 1.:
-                    df.loc[j, name] = float(unit.convert_from(un.loc[0, name], df.loc[j, name]))
+            speed = df[name].astype(float)
+            df[name] = speed.where(speed <= 1., unit.convert_from(un.loc[0, name], speed))     # Values above 1 are speeds
+            if split_speed:
+                df, un = split_speed_column(df, un, name)
     return df,un
 
 
+def split_speed_column(df, un, name):
+    """Add explicit Mach and true air speed columns for a column mixing both, values above 1 being speeds
+    Columns are named after name with the ending _speed replaced, Mach is NaN on speed rows and the other way round
+    """
+    root = name[:-len("_speed")] if name.endswith("_speed") else name
+    speed = df[name]
+    df = df.assign(**{root + "_mach": speed.where(speed <= 1.), root + "_tas": speed.where(1. < speed)})
+    un = un.assign(**{root + "_mach": ["mach", np.nan], root + "_tas": [un.loc[0, name], np.nan]})
+    return df, un
+
+
 def lin_lst_reg(df, abs, ord, order):
     """Linear least square regression of "ord" versus "abs" with given order
     order is the list of exponents to apply
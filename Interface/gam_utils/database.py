@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Indexed access to the airplane data base
+
+Row positions of each value of the key columns are hashed once, lookups then cost a dictionary access instead of a scan
+of the whole data base. Selections and property tables matching rows are memoized as the data base is never modified,
+in size bounded LRU memos as criteria may come from free text inputs.
+
+:author: Conceptual Airplane Design & Operations (CADO team)
+         Aircraft & Systems, Air Transport Department, ENAC
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# Values of the unit rows of the raw data base, they are not data
+UNIT_LABELS = ["string", "mach", "None", "unknown", "int", "m", "deg", "m2", "kg", "no_dim", "kW", "N", "km/h", "ft", "km"]
+
+
+class AirplaneDatabase(object):
+    """Airplane data base with hash indexes on its key columns
+    """
+
+    def __init__(self, df, keys=("Constructor", "icao_code", "iata_code", "airplane_type", "name"), maxsize=256):
+        self.df = df
+        self.keys = [k for k in keys if k in df.columns]
+        self.index = {k: df.groupby(k, sort=False, dropna=True).indices for k in self.keys}
+        self.maxsize = maxsize
+        self.selections = OrderedDict()
+        self.tables = OrderedDict()
+        self.lock = threading.Lock()
+
+    def recall(self, memo, key):
+        """Entry of memo stored under key, None if there is none
+        """
+        with self.lock:
+            entry = memo.get(key)
+            if entry is not None:
+                memo.move_to_end(key)
+            return entry
+
+    def memorize(self, memo, key, entry):
+        """Store entry under key in memo, least recently used entries are dropped beyond maxsize
+        """
+        with self.lock:
+            memo[key] = entry
+            while len(memo) > self.maxsize:
+                memo.popitem(last=False)
+
+    def positions(self, **criteria):
+        """Sorted row positions matching all criteria, given as key=value
+        """
+        if not criteria:
+            return np.arange(len(self.df))
+        found = None
+        for key, value in criteria.items():
+            if key not in self.index:
+                raise Exception("Column is not indexed : ", key)
+            pos = self.index[key].get(value, np.zeros(0, dtype=int))
+            found = pos if found is None else np.intersect1d(found, pos, assume_unique=True)
+        return np.sort(found)
+
+    def rows(self, **criteria):
+        """Rows matching all criteria, in data base order, the DataFrame is shared and must not be modified
+        """
+        key = tuple(sorted(criteria.items()))
+        rows = self.recall(self.selections, key)
+        if rows is None:
+            rows = self.df.iloc[self.positions(**criteria)]
+            if 0 < len(rows):
+                self.memorize(self.selections, key, rows)
+        return rows
+
+    def first(self, column, **criteria):
+        """Value of column in the first row matching all criteria, None if there is none
+        """
+        pos = self.positions(**criteria)
+        if len(pos) == 0:
+            return None
+        return self.df[column].iloc[pos[0]]
+
+    def values(self, key):
+        """Distinct values of a key column in order of appearance, unit labels apart
+        """
+        return [v for v in self.index[key].keys() if v not in UNIT_LABELS]
+
+    def property_table(self, prop, **criteria):
+        """Table with a Property column holding prop and one column per row matching all criteria, named 1, 2, ...
+        Properties missing from the data base are shown as N/A, the DataFrame is shared and must not be modified
+        """
+        key = (tuple(prop), tuple(sorted(criteria.items())))
+        table = self.recall(self.tables, key)
+        if table is not None:
+            return table
+        rows = self.rows(**criteria)
+        table = pd.DataFrame({"Property": prop})
+        for idx in range(len(rows)):
+            table[f"{idx + 1}"] = [rows[p].iloc[idx] if p in rows.columns else "N/A" for p in prop]
+        if 0 < len(rows):
+            self.memorize(self.tables, key, table)
+        return table
+
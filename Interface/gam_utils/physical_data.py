@@ -7,9 +7,9 @@ Created on Thu Jan 24 23:22:21 2019
          PETEILH Nicolas : portage to Python
 """
 
-import numpy as np
+import math
 
-from scipy.optimize import fsolve
+import numpy as np
 
 
 
@@ -46,6 +46,9 @@ class PhysicalData(object):
             else:
                 self.P[j + 1] = self.P[j] * np.exp(-(self.g / self.r) * ((self.Z[j + 1] - self.Z[j]) / self.T[j]))
 
+        # Base altitude, pressure, temperature and gradient of each layer as floats, see the scalar path of atmosphere()
+        self.layers = list(zip(self.Z.tolist(), self.P.tolist(), self.T.tolist(), self.dtodz.tolist()))
+
         self.fuel_density_data = {"kerosene": 803.0,
                                   "petrol": 803.0,
                                   "e_fuel": 803.0,
@@ -65,6 +68,8 @@ class PhysicalData(object):
                                "liquid_nh3": 16.89e6,
                                "solid_nh3": 16.89e6}
 
+        self.isa_table = None   # Optional interpolation table of the standard atmosphere, see set_isa_table()
+
 
     def fuel_density(self, fuel_type, press=101325.):
         """Reference fuel density
@@ -130,22 +135,78 @@ class PhysicalData(object):
         re = rho * vsnd * mach / mu
         return re
 
-    def atmosphere(self, altp, disa):
-        """Pressure and temperature from pressure altitude from ground to 50 km
+    def set_isa_table(self, step=10.):
+        """Precompute the standard atmosphere on a regular grid of pressure altitudes, used afterwards by atmosphere(),
+        pressure() and pressure_altitude() through interpolation, step = None switches back to exact formulas
+        Temperature is exact if the step divides the layer boundaries, log(pressure) is linearly interpolated
+        """
+        if step is None:
+            self.isa_table = None
+            return
+        self.isa_table = None
+        altp = np.arange(0., self.Z[-1] + 0.5 * step, step)
+        altp[-1] = self.Z[-1]
+        pamb, tamb, tstd, dtodz = self.atmosphere(altp, 0.)
+        self.isa_table = {"altp": altp, "log_pamb": np.log(pamb), "tstd": tstd}
+
+    def layer_index(self, altp):
+        """Index of the standard atmosphere layer containing the pressure altitude(s) altp
+        """
+        if np.any(self.Z[-1] < altp):
+            raise Exception("pressure_altitude, altitude cannot exceed 50km")
+        return np.minimum(np.searchsorted(self.Z[1:], altp, side="right"), len(self.dtodz) - 1)
+
+    def layer_pressure(self, dz, p_base, t_base, dtodz):
+        """Pressure at height dz above the base of an atmosphere layer, all inputs can be arrays
         """
         g = self.gravity()
         R, gam, Cp, Cv = self.gas_data()
+        slope = np.where(0. < np.abs(dtodz), dtodz, 1.)     # Avoids dividing by zero in isothermal layers
+        pamb = np.where(0. < np.abs(dtodz),
+                        p_base * (1 + (slope / t_base) * dz) ** (-g / (R * slope)),
+                        p_base * np.exp(-(g / R) * (dz / t_base)))
+        return pamb[()]
+
+    def layer_height(self, pamb, p_base, t_base, dtodz):
+        """Height above the base of an atmosphere layer where pressure is pamb, inverse of layer_pressure()
+        """
+        g = self.gravity()
+        R, gam, Cp, Cv = self.gas_data()
+        slope = np.where(0. < np.abs(dtodz), dtodz, 1.)
+        dz = np.where(0. < np.abs(dtodz),
+                      ((pamb / p_base) ** (-(R * slope) / g) - 1) * (t_base / slope),
+                      - (t_base / (g / R)) * np.log(pamb / p_base))
+        return dz[()]
 
-        if (self.Z[-1] < altp):
-            raise Exception("pressure_altitude, altitude cannot exceed 50km")
+    def atmosphere(self, altp, disa):
+        """Pressure and temperature from pressure altitude from ground to 50 km
+        altp and disa can be arrays
+        """
+        if isinstance(altp, (float, int)) and isinstance(disa, (float, int)) and self.isa_table is None:
+            # Scalar fast path, array operations cost more than the formula of the layer for a single value
+            if self.Z[-1] < altp:
+                raise Exception("pressure_altitude, altitude cannot exceed 50km")
+            j = 0
+            while j < len(self.layers) - 1 and self.layers[j + 1][0] <= altp:
+                j += 1
+            z, p, t, dtodz = self.layers[j]
+            g = self.gravity()
+            R, gam, Cp, Cv = self.gas_data()
+            if (0. < abs(dtodz)):
+                pamb = p * (1 + (dtodz / t) * (altp - z)) ** (-g / (R * dtodz))
+            else:
+                pamb = p * math.exp(-(g / R) * ((altp - z) / t))
+            tstd = t + dtodz * (altp - z)
+            return pamb, tstd + disa, tstd, dtodz
 
-        j = np.searchsorted(self.Z[1:], altp, side="right")
+        j = self.layer_index(altp)
 
-        if (0. < np.abs(self.dtodz[j])):
-            pamb = self.P[j] * (1 + (self.dtodz[j] / self.T[j]) * (altp - self.Z[j])) ** (-g / (R * self.dtodz[j]))
+        if self.isa_table is not None:
+            pamb = np.exp(np.interp(altp, self.isa_table["altp"], self.isa_table["log_pamb"]))
+            tstd = np.interp(altp, self.isa_table["altp"], self.isa_table["tstd"])
         else:
-            pamb = self.P[j] * np.exp(-(g / R) * ((altp - self.Z[j]) / self.T[j]))
-        tstd = self.T[j] + self.dtodz[j] * (altp - self.Z[j])
+            pamb = self.layer_pressure(altp - self.Z[j], self.P[j], self.T[j], self.dtodz[j])
+            tstd = self.T[j] + self.dtodz[j] * (altp - self.Z[j])
         tamb = tstd + disa
 
         return pamb, tamb, tstd, self.dtodz[j]
@@ -159,50 +220,35 @@ class PhysicalData(object):
 
     def pressure_altitude(self, pamb):
         """Pressure altitude from ground to 50 km
+        pamb can be an array
         """
-        g = self.gravity()
-        R, gam, Cp, Cv = self.gas_data()
-
-        if (pamb < self.P[-1]):
+        if np.any(pamb < self.P[-1]):
             raise Exception("pressure_altitude, altitude cannot exceed 50km")
 
-        j = np.searchsorted(-self.P[1:], -pamb, side="right")
+        if self.isa_table is not None:
+            return np.interp(-np.log(pamb), -self.isa_table["log_pamb"], self.isa_table["altp"])
 
-        if (0. < np.abs(self.dtodz[j])):
-            altp = self.Z[j] + ((pamb / self.P[j]) ** (-(R * self.dtodz[j]) / g) - 1) * (self.T[j] / self.dtodz[j])
-        else:
-            altp = self.Z[j] - (self.T[j] / (g / R)) * np.log(pamb / self.P[j])
+        j = np.minimum(np.searchsorted(-self.P[1:], -pamb, side="right"), len(self.dtodz) - 1)
+        altp = self.Z[j] + self.layer_height(pamb, self.P[j], self.T[j], self.dtodz[j])
 
         return altp
 
     def pressure(self, altp):
         """Pressure from pressure altitude from ground to 50 km
+        altp can be an array
         """
-        g = self.gravity()
-        R, gam, Cp, Cv = self.gas_data()
-
-        if (self.Z[-1] < altp):
-            raise Exception("pressure_altitude, altitude cannot exceed 50km")
-
-        j = np.searchsorted(self.Z[1:], altp, side="right")
-
-        if (0. < np.abs(self.dtodz[j])):
-            pamb = self.P[j] * (1 + (self.dtodz[j] / self.T[j]) * (altp - self.Z[j])) ** (-g / (R * self.dtodz[j]))
-        else:
-            pamb = self.P[j] * np.exp(-(g / R) * ((altp - self.Z[j]) / self.T[j]))
-
+        pamb, tamb, tstd, dtodz = self.atmosphere(altp, 0.)
         return pamb
 
-    def atmosphere_geo(self, altg, disa):
-        """Pressure and temperature from geometrical altitude from ground to 50 km
+    def geo_layers(self, disa):
+        """Altitudes, pressures and temperatures at the boundaries of the layers and temperature gradients
+        in geometrical altitude, disa can be an array, the layer index is then the first axis of all outputs
         """
-        g = self.gravity()
-        R, gam, Cp, Cv = self.gas_data()
-
-        Z = np.zeros_like(self.Z)
-        dtodz = np.zeros_like(self.dtodz)
-        P = np.zeros_like(self.P)
-        T = np.zeros_like(self.T)
+        shape = np.shape(disa)
+        Z = np.zeros((len(self.Z),) + shape)
+        dtodz = np.zeros((len(self.dtodz),) + shape)
+        P = np.zeros((len(self.P),) + shape)
+        T = np.zeros((len(self.T),) + shape)
 
         P[0] = self.sea_level_pressure()
         T[0] = self.sea_level_temperature()
@@ -211,38 +257,46 @@ class PhysicalData(object):
             K = 1 + disa / self.T[j]
             dtodz[j] = self.dtodz[j] / K
             Z[j + 1] = Z[j] + (self.Z[j + 1] - self.Z[j]) * K
-
             T[j + 1] = T[j] + dtodz[j] * (Z[j + 1] - Z[j])
-            if (0. < np.abs(dtodz[j])):
-                P[j + 1] = P[j] * (1. + (dtodz[j] / (T[j] + disa)) * (Z[j + 1] - Z[j])) ** (-g / (R * dtodz[j]))
-            else:
-                P[j + 1] = P[j] * np.exp(-(g / R) * ((Z[j + 1] - Z[j]) / (T[j] + disa)))
+            P[j + 1] = self.layer_pressure(Z[j + 1] - Z[j], P[j], T[j] + disa, dtodz[j])
+
+        return Z, P, T, dtodz
+
+    def pick_layer(self, table, j):
+        """Value of table in layer j, table and j are shaped like the outputs of geo_layers()
+        """
+        return np.take_along_axis(table, np.asarray(j)[None], axis=0)[0][()]
 
-        if (Z[-1] < altg):
+    def atmosphere_geo(self, altg, disa):
+        """Pressure and temperature from geometrical altitude from ground to 50 km
+        altg and disa can be arrays
+        """
+        shape = np.broadcast_shapes(np.shape(altg), np.shape(disa))
+        Z, P, T, dtodz = self.geo_layers(np.broadcast_to(disa, shape))
+
+        if np.any(Z[-1] < altg):
             raise Exception("atmosphere_geo, altitude cannot exceed 50km")
 
-        j = np.searchsorted(self.Z[1:], altg, side="right")
+        j = np.minimum(np.sum(Z[1:] <= np.broadcast_to(altg, shape), axis=0), len(self.dtodz) - 1)
 
-        if (0. < np.abs(dtodz[j])):
-            pamb = P[j] * (1 + (dtodz[j] / (T[j] + disa)) * (altg - Z[j])) ** (-g / (R * dtodz[j]))
-        else:
-            pamb = P[j] * np.exp(-(g / R) * ((altg - Z[j]) / (T[j] + disa)))
-        tamb = T[j] + dtodz[j] * (altg - Z[j]) + disa
+        z_j, p_j, t_j, a_j = [self.pick_layer(x, j) for x in (Z, P, T, dtodz)]
+        pamb = self.layer_pressure(altg - z_j, p_j, t_j + disa, a_j)
+        tamb = t_j + a_j * (altg - z_j) + disa
 
-        return pamb, tamb, dtodz[j]
+        return pamb, tamb, a_j
 
     def altg_from_altp(self, altp, disa):
         """Geometrical altitude from pressure altitude
+        Pressure is inverted directly in the layer of the geometrical atmosphere, altp and disa can be arrays
         """
-        def fct(altg, altp, disa):
-            pamb, tamb, dtodz = self.atmosphere_geo(altg, disa)
-            zp = self.pressure_altitude(pamb)
-            return altp - zp
+        shape = np.broadcast_shapes(np.shape(altp), np.shape(disa))
+        pamb = self.pressure(altp)
+        Z, P, T, dtodz = self.geo_layers(np.broadcast_to(disa, shape))
 
-        output_dict = fsolve(fct, x0=altp, args=(altp, disa), full_output=True)
+        j = np.minimum(np.sum(P[1:] >= np.broadcast_to(pamb, shape), axis=0), len(self.dtodz) - 1)
 
-        altg = output_dict[0][0]
-        if (output_dict[2] != 1): raise Exception("Convergence problem")
+        z_j, p_j, t_j, a_j = [self.pick_layer(x, j) for x in (Z, P, T, dtodz)]
+        altg = z_j + self.layer_height(pamb, p_j, t_j + disa, a_j)
 
         return altg
 
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A root finding toolbox for the GAM sizing and mission loops
+
+Residuals of the GAM are smooth closed form expressions whose exact derivatives are delivered by the model itself,
+Newton iterations are then used with a fallback on bracketing methods when they fail.
+
+:author: Conceptual Airplane Design & Operations (CADO team)
+         Aircraft & Systems, Air Transport Department, ENAC
+"""
+
+import numpy as np
+from scipy.optimize import brentq, fsolve
+
+
+def solver_info(method, niter, nfev, converged):
+    """Iteration counts of a solve
+    """
+    return {"method": method, "niter": niter, "nfev": nfev, "converged": converged}
+
+
+def bracket_root(fct, x0, factor=2., maxiter=40):
+    """Search an interval around x0 where fct changes its sign, looking geometrically on both sides of x0
+    Only positive values are explored as GAM unknowns are masses or distances
+
+    :param fct: scalar function
+    :param x0: positive starting point
+    :return: (a, b, nfev), a and b are None if no sign change was found
+    """
+    y0 = fct(x0)
+    nfev = 1
+    for j in range(1, maxiter + 1):
+        for x in [x0 / factor**j, x0 * factor**j]:
+            y = fct(x)
+            nfev += 1
+            if np.isfinite(y) and np.isfinite(y0) and np.sign(y) != np.sign(y0):
+                return min(x, x0), max(x, x0), nfev
+    return None, None, nfev
+
+
+def newton_1d(fct, x0, xtol=1.e-10, maxiter=50, max_halving=8):
+    """Solve fct(x) = 0 with Newton steps using the exact derivative delivered by fct
+    A step is halved while the residual is not finite or grows, the solve falls back to Brent method
+    on a bracketing interval when Newton iterations fail
+
+    :param fct: function with the signature y, dy_dx = fct(x)
+    :param x0: starting point
+    :return: (x, info), see solver_info()
+    """
+    x = x0
+    y, dy = fct(x)
+    nfev = 1
+    for niter in range(1, maxiter + 1):
+        if not (np.isfinite(y) and np.isfinite(dy)) or dy == 0.:
+            break
+        dx = -y / dy
+        if abs(dx) <= xtol * abs(x):
+            return x + dx, solver_info("newton", niter, nfev, True)
+        for j in range(max_halving):
+            y_new, dy_new = fct(x + dx)
+            nfev += 1
+            if np.isfinite(y_new) and abs(y_new) <= abs(y):
+                break
+            dx = 0.5 * dx
+        else:
+            break
+        x, y, dy = x + dx, y_new, dy_new
+        if y == 0.:
+            return x, solver_info("newton", niter, nfev, True)
+
+    # Fallback on a bracketing method
+    def fct_value(x):
+        return fct(x)[0]
+
+    a, b, n_bracket = bracket_root(fct_value, x0)
+    nfev += n_bracket
+    if a is None:
+        return x, solver_info("newton", niter, nfev, False)
+    x, res = brentq(fct_value, a, b, xtol=xtol * abs(x0), rtol=4. * np.finfo(float).eps, full_output=True, disp=False)
+    return x, solver_info("brent", res.iterations, nfev + res.function_calls, res.converged)
+
+
+def newton_nd(fct, x0, xtol=1.e-10, maxiter=50, max_halving=8):
+    """Solve the system fct(x) = 0 with Newton steps using the exact Jacobian delivered by fct
+    The solve falls back to fsolve, fed with the same Jacobian, when Newton iterations fail
+
+    :param fct: function with the signature y, jac = fct(x), y is a vector and jac a square matrix
+    :param x0: starting point
+    :return: (x, info), see solver_info()
+    """
+    x = np.array(x0, dtype=float)
+    y, jac = fct(x)
+    nfev = 1
+    for niter in range(1, maxiter + 1):
+        try:
+            dx = -np.linalg.solve(jac, y)
+        except np.linalg.LinAlgError:
+            break
+        if not np.all(np.isfinite(dx)):
+            break
+        if np.all(np.abs(dx) <= xtol * np.abs(x)):
+            return x + dx, solver_info("newton", niter, nfev, True)
+        for j in range(max_halving):
+            y_new, jac_new = fct(x + dx)
+            nfev += 1
+            if np.all(np.isfinite(y_new)) and np.linalg.norm(y_new) <= np.linalg.norm(y):
+                break
+            dx = 0.5 * dx
+        else:
+            break
+        x, y, jac = x + dx, np.asarray(y_new, dtype=float), jac_new
+
+    # Fallback on fsolve
+    output_dict = fsolve(lambda z: fct(z)[0], x0=np.array(x0, dtype=float), fprime=lambda z: fct(z)[1], full_output=True)
+    return output_dict[0], solver_info("fsolve", output_dict[1]["nfev"], nfev + output_dict[1]["nfev"] + output_dict[1]["njev"],
+                                       output_dict[2] == 1)
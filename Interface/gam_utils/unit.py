@@ -8,8 +8,7 @@ Created on Thu Jan 24 23:22:21 2019
 """
 
 import numpy
-
-from copy import deepcopy
+import pandas
 
 
 def kg_t(t): return t*1000.
@@ -604,8 +603,39 @@ UNIT["array"] = 1
 
 # Conversion functions
 #-------------------------------------------------------------------------
+NUMERIC_KINDS = ["floating", "integer", "mixed-integer-float", "decimal", "empty"]
+
+
+def is_numeric(val):
+    """True if the array or the Series val only holds numbers, missing values apart, so it can be scaled in one operation
+    """
+    if val.dtype.kind in "iufc":
+        return True
+    if val.dtype.kind == "O":
+        return pandas.api.types.infer_dtype(val, skipna=True) in NUMERIC_KINDS
+    return False
+
+
+def scale(val, factor, convert, ulab, integer=False):
+    """Multiply an array, a Series or each column of a DataFrame by factor in one operation
+    Values are truncated to integers first if integer is True, see convert_to()
+    Arrays and columns holding non numeric values are converted value by value with convert(ulab, v)
+    """
+    if isinstance(val, pandas.DataFrame):
+        return pandas.concat([scale(val.iloc[:, j], factor, convert, ulab, integer) for j in range(val.shape[1])], axis=1)
+    if not is_numeric(val):
+        if isinstance(val, pandas.Series):
+            return val.map(lambda v: convert(ulab, v))
+        return numpy.array([convert(ulab, v) for v in val])
+    num = val.astype(float) if val.dtype.kind == "O" else val
+    if integer:
+        num = numpy.trunc(num)
+    return num * factor
+
+
 def convert_from(ulab, val):
     """Convert val expressed in ulab to corresponding standard unit
+    Numeric arrays, Series and DataFrames are converted with a single multiplication, see scale()
     :param ulab: unit label. ex: 'NM' for Nautical miles
     :param val: the value to convert to SI units
     :return: val converted to SI units
@@ -616,14 +646,11 @@ def convert_from(ulab, val):
     if isinstance(val, list):
         return [convert_from(ulab, v) for v in val]
     if isinstance(val, tuple):
-        return (convert_from(ulab, v) for v in val)
-    if isinstance(val, numpy.ndarray):
-        return numpy.array([convert_from(ulab, v) for v in val])
+        return tuple([convert_from(ulab, v) for v in val])
+    if isinstance(val, (numpy.ndarray, pandas.Series, pandas.DataFrame)):
+        return scale(val, UNIT[ulab], convert_from, ulab)
     if isinstance(val, dict):
-        dic_val = deepcopy(val)
-        for k, v in dic_val.items():
-            dic_val[k] = convert_from(ulab, v)
-        return dic_val
+        return {k: convert_from(ulab, v) for k, v in val.items()}
     return val * UNIT[ulab]
 
 
@@ -635,18 +662,39 @@ def convert_to(ulab, val):
         return [convert_to(ulab, v) for v in val]
     if isinstance(val, tuple):
         return tuple([convert_to(ulab, v) for v in val])
-    if isinstance(val, numpy.ndarray):
-        return numpy.array([convert_to(ulab, v) for v in val])
+    if isinstance(val, (numpy.ndarray, pandas.Series, pandas.DataFrame)):
+        return scale(val, 1. / UNIT[ulab], convert_to, ulab, integer=ulab in ["integer", "int", "entier", "numeric"])
     if isinstance(val, dict):
-        dic_val = deepcopy(val)
-        for k, v in dic_val.items():
-            dic_val[k] = convert_to(ulab, v)
-        return dic_val
+        return {k: convert_to(ulab, v) for k, v in val.items()}
     if ulab in ["integer", "int", "entier", "numeric"]:
         val = int(val)
     return val / UNIT[ulab]
 
 
+def convert_columns(convert, umap, df):
+    """Convert the columns of df named in umap, a dictionary {column: unit label}, other columns are kept as they are
+    Text and structure labels are skipped, the columns of df are not copied
+    """
+    skip = ["string", "text", "text_date", "structure", "dict", "array"]
+    out = df.copy(deep=False)
+    for name, ulab in umap.items():
+        if name in df.columns and ulab not in skip:
+            out[name] = convert(ulab, df[name])
+    return out
+
+
+def convert_columns_from(umap, df):
+    """Convert the columns of df named in umap from their unit to standard units, see convert_columns()
+    """
+    return convert_columns(convert_from, umap, df)
+
+
+def convert_columns_to(umap, df):
+    """Convert the columns of df named in umap from standard units to their unit, see convert_columns()
+    """
+    return convert_columns(convert_to, umap, df)
+
+
 def pretty_print(fmt, v, u):
     w = str(convert_to(u, v))
     s = eval("'"+fmt+"'"+"%"+w)
@@ -2,17 +2,11 @@ from pandas._libs.lib import is_integer
 from pandas._libs.lib import is_float
 import streamlit as st
 import pandas as pd
-from gam_copy import GAM
+import app_cache
 from gam_utils import unit
 
 
 
-# Load data from the Excel file
-def load_data(file):
-    '''Read Excel files'''
-    return pd.read_excel(file)
-
-
 def setup3():
     if "VARG2" not in st.session_state:
         st.session_state.VARG2 = []
@@ -23,7 +17,8 @@ def setup3():
     file = "airplane_database_copieVF.xlsx"
 
     try:
-        data_airplanes= load_data(file)
+        airplane_db = app_cache.load_database(file)     # Indexed data base shared by all sessions
+        data_airplanes = airplane_db.df
     except FileNotFoundError as e:
         st.error(f"File not found: {e.filename}")
         return
@@ -43,12 +38,7 @@ def setup3():
 
     if search_option == "By Aircraft manufactor and ICAO Code":
         # List of the name of the aircraft construstor
-        constructor = [" "]
-        errors = ["string", "mach", "None", "unknown", "int", "m", "deg", "m2", "kg", "no_dim", "kW", "N", "km/h", "ft", "km"]
-        for element in data_airplanes["Constructor"]:
-            if element not in errors:
-                if element not in constructor:
-                    constructor.append(element)
+        constructor = [" "] + [c for c in airplane_db.values("Constructor") if c != " "]
 
         # Chose of the constructor
         constructor1 = st.selectbox('From which constructor your plane come?',
@@ -56,13 +46,8 @@ def setup3():
 
         if constructor1 != " ":
             st.success(f"You selected: {constructor1}")
-            data_airplanes_cons = data_airplanes[data_airplanes["Constructor"] == constructor1]
-            if not data_airplanes_cons.empty:
-                combined_data = pd.DataFrame({"Property": prop})
-                for idx, (_, row) in enumerate(data_airplanes_cons.iterrows(), start=1):
-                    column_name = f"{idx}"
-                    combined_data[column_name] = [row.get(p, "N/A") for p in prop]
-                st.dataframe(combined_data, hide_index=True)
+            if not airplane_db.rows(Constructor=constructor1).empty:
+                st.dataframe(airplane_db.property_table(prop, Constructor=constructor1), hide_index=True)
 
 
             # User input for ICAO code
@@ -70,27 +55,15 @@ def setup3():
 
             if icao_code:
                 # Find the IATA code from the ICAO code
-                filtered_icao = data_airplanes[data_airplanes["icao_code"] == icao_code]
+                iata_code = airplane_db.first("iata_code", icao_code=icao_code)
 
-                if not filtered_icao.empty:
-                    iata_code = filtered_icao["iata_code"].iloc[0]
+                if iata_code is not None:
                     st.success(f"IATA code found: {iata_code}")
 
                     # Filter airplane details by IATA code and selected construtor
-                    airplane_info = data_airplanes[
-                        (data_airplanes["iata_code"] == iata_code) &
-                        (data_airplanes["Constructor"] == constructor1)
-                    ]
-
-                    if not airplane_info.empty:
+                    if not airplane_db.rows(iata_code=iata_code, Constructor=constructor1).empty:
                         st.success(f"Airplane details for IATA code '{iata_code}' and constructor '{constructor1}':")
-                        combined_data = pd.DataFrame({"Property": prop})
-
-                        for idx, (_, row) in enumerate(airplane_info.iterrows(), start=1):
-                            column_name = f"{idx}"
-                            combined_data[column_name] = [row.get(p, "N/A") for p in prop]
-
-                        st.dataframe(combined_data, hide_index=True)
+                        st.dataframe(airplane_db.property_table(prop, iata_code=iata_code, Constructor=constructor1), hide_index=True)
 
                     else:
                         st.warning(f"No airplane details found for IATA code '{iata_code}' and constructor '{constructor1}'.")
@@ -114,41 +87,23 @@ def setup3():
 
         if selected_type1 != " ":
             st.success(f"You selected: {selected_type1}")
-            data_airplanes_type = data_airplanes[data_airplanes["airplane_type"] == selected_type]
-            if not data_airplanes_type.empty:
-                combined_data = pd.DataFrame({"Property": prop})
-
-                for idx, (_, row) in enumerate(data_airplanes_type.iterrows(), start=1):
-                    column_name = f"{idx}"
-                    combined_data[column_name] = [row.get(p, "N/A") for p in prop]
-                st.dataframe(combined_data, hide_index=True)
+            if not airplane_db.rows(airplane_type=selected_type).empty:
+                st.dataframe(airplane_db.property_table(prop, airplane_type=selected_type), hide_index=True)
 
             # User input for ICAO code
             icao_code = st.text_input("Enter an ICAO code:")
 
             if icao_code:
                 # Find the IATA code from the ICAO code
-                filtered_icao = data_airplanes[data_airplanes["icao_code"] == icao_code]
+                iata_code = airplane_db.first("iata_code", icao_code=icao_code)
 
-                if not filtered_icao.empty:
-                    iata_code = filtered_icao["iata_code"].iloc[0]
+                if iata_code is not None:
                     st.success(f"IATA code found: {iata_code}")
 
                     # Filter airplane details by IATA code and selected type
-                    airplane_info = data_airplanes[
-                        (data_airplanes["iata_code"] == iata_code) &
-                        (data_airplanes["airplane_type"] == selected_type)
-                    ]
-
-                    if not airplane_info.empty:
+                    if not airplane_db.rows(iata_code=iata_code, airplane_type=selected_type).empty:
                         st.success(f"Airplane details for IATA code '{iata_code}' and type '{selected_type1}':")
-                        combined_data = pd.DataFrame({"Property": prop})
-
-                        for idx, (_, row) in enumerate(airplane_info.iterrows(), start=1):
-                            column_name = f"{idx}"
-                            combined_data[column_name] = [row.get(p, "N/A") for p in prop]
-
-                        st.dataframe(combined_data, hide_index=True)
+                        st.dataframe(airplane_db.property_table(prop, iata_code=iata_code, airplane_type=selected_type), hide_index=True)
 
                     else:
                         st.warning(f"No airplane details found for IATA code '{iata_code}' and type '{selected_type1}'.")
@@ -163,24 +118,15 @@ def setup3():
 
         if icao_code:
             # Find the IATA code from the ICAO code
-            filtered_icao = data_airplanes[data_airplanes["icao_code"] == icao_code]
+            iata_code = airplane_db.first("iata_code", icao_code=icao_code)
 
-            if not filtered_icao.empty:
-                iata_code = filtered_icao["iata_code"].iloc[0]
+            if iata_code is not None:
                 st.success(f"IATA code found: {iata_code}")
 
                 # Retrieve all airplane details for the matched IATA code
-                airplane_info = data_airplanes[data_airplanes["iata_code"] == iata_code]
-
-                if not airplane_info.empty:
+                if not airplane_db.rows(iata_code=iata_code).empty:
                     st.success(f"Airplane details for IATA code '{iata_code}':")
-                    combined_data = pd.DataFrame({"Property": prop})
-
-                    for idx, (_, row) in enumerate(airplane_info.iterrows(), start=1):
-                        column_name = f"{idx}"
-                        combined_data[column_name] = [row.get(p, "N/A") for p in prop]
-
-                    st.dataframe(combined_data, hide_index=True)
+                    st.dataframe(airplane_db.property_table(prop, iata_code=iata_code), hide_index=True)
                 else:
                     st.warning(f"No airplane details found for IATA code '{iata_code}'.")
             else:
@@ -192,20 +138,14 @@ def setup3():
     # User input for airplane name
     airplane = st.text_input("Enter the name of your aircraft (you can use the search tool just above): ")
     final_data = []
-    if data_airplanes[data_airplanes["name"] == airplane].empty:
+    if airplane_db.rows(name=airplane).empty:
         st.warning(f"No airplane found for the name '{airplane}'.")
-    if airplane != "" and not data_airplanes[data_airplanes["name"] == airplane].empty and data_airplanes[data_airplanes["name"] == airplane][data_airplanes["airplane_type"] == "business"].empty:
+    if airplane != "" and not airplane_db.rows(name=airplane).empty and airplane_db.rows(name=airplane, airplane_type="business").empty:
         st.success(f"Airplane found: {airplane}")
 
         # Data of the plane the user search
-        final_data = data_airplanes[data_airplanes["name"] == airplane]
-        final = pd.DataFrame({"Property": prop})
-
-        for idx, (_, row) in enumerate(final_data.iterrows(), start=1):
-            column_name = f"{idx}"
-            final[column_name] = [row.get(p, "N/A") for p in prop]
-
-        st.dataframe(final, hide_index=True)
+        final_data = airplane_db.rows(name=airplane)
+        st.dataframe(airplane_db.property_table(prop, name=airplane), hide_index=True)
 
 
         st.write("")
@@ -224,7 +164,7 @@ def setup3():
                           "owe": "",
                           "payload": "",
                           "payload_max": "",}
-        gam = GAM()
+        gam = app_cache.new_gam()
 
 
         # Complete the power systeme
@@ -355,18 +295,16 @@ def setup3():
                 design_mission["altitude"] = int(cruise_altitude)*0.3048
 
         # Complete MTOW
+        final_mtow = set(final_data["mtow"])
         for e in data_airplanes["mtow"]:
-            if e not in errors:
-                test_mtow = final_data[final_data["mtow"] == e]
-                if not test_mtow.empty:
-                    design_mission["mtow"] = e
+            if e not in errors and e == e and e in final_mtow:
+                design_mission["mtow"] = e
 
         # Complete OWE
+        final_owe = set(final_data["owe"])
         for e in data_airplanes["owe"]:
-            if e not in errors:
-                test_owe = final_data[final_data["owe"] == e]
-                if not test_owe.empty:
-                    design_mission["owe"] = e
+            if e not in errors and e == e and e in final_owe:
+                design_mission["owe"] = e
 
         # Complete payload
         for key in dis:
@@ -947,7 +885,7 @@ def setup3():
                             st.warning("Please select all the parameters for the design missoin.")
 
 
-                    gam2 = GAM()
+                    gam2 = app_cache.new_gam()
                     table_rows_2 = []
                     this_dict2 = gam2.tune_design(t_power, t_mission)
                     st.write("What property of the airplane do you want to see:")
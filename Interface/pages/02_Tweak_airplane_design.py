@@ -1,14 +1,14 @@
 from pandas._libs.lib import is_integer, is_float
 import streamlit as st
 import pandas as pd
-from gam_copy import GAM
+import app_cache
 from gam_utils import unit
 
 
 def tweak_graphic():
     if "VARG3" not in st.session_state:
         st.session_state.VARG3 = []
-    gam = GAM()
+    gam = app_cache.new_gam()
 
     dis = {"general": 95, "commuter": 105, "regional": 110,
         "short_medium": 115, "long_range": 120}
@@ -1,9 +1,9 @@
 import streamlit as st
-from gam_copy import GAM
+import app_cache
 
 
 def graphic():
-    gam = GAM()
+    gam = app_cache.new_gam()
     graph_list = []
     name_list = []
     if st.session_state.VARG1:
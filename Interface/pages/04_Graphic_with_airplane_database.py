@@ -2,11 +2,12 @@ import streamlit as st
 import pandas as pd
 #import matplotlib as plt
 import plotly.express as px
+import app_cache
 
 # Load data from the Excel file
 def load_data(files):
-    '''Read Excel files'''
-    return pd.read_excel(files)
+    '''Read Excel files, parsed sheets are cached for all sessions'''
+    return app_cache.read_excel(files)
 
 st.title("Graphics from Airplane Data Base")
 
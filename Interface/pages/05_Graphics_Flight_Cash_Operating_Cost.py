@@ -8,7 +8,7 @@ import matplotlib.patches as mpatches
 #from gam_utils import unit
 #from gam_copy import GAM
 
-from draw_domains import find_index#, draw_domains
+import app_cache
 from doc_vs_techno_commuter_modify import init_commuter
 from doc_vs_techno_regional_modify import init_regional
 from doc_vs_techno_long_range_modify import init_long
@@ -20,17 +20,13 @@ def pritting_fuel():
     stdm_factor = 1.0
     lod_factor = 1.0
 
-    def plot_domain(ax, init_function, title):
-        gam, design_mission, power_system, dist_window, npax_window, criterion = init_function(
-            max_fuel_factor, stdm_factor, lod_factor,
-            battery_density, fuel_cell_power_density, lh2_tank_index,
-            emotor_price, fuel_cell_price, lh2_tank_price, battery_capacity_price,
-            battery_price, lh2_price, lch4_price, e_fuel_price
-        )
-        color_ind, npax_list, dist_list = find_index(
-            gam, design_mission, power_system, dist_window, npax_window, criterion
-        )
+    def domain_inputs():
+        return (max_fuel_factor, stdm_factor, lod_factor,
+                battery_density, fuel_cell_power_density, lh2_tank_index,
+                emotor_price, fuel_cell_price, lh2_tank_price, battery_capacity_price,
+                battery_price, lh2_price, lch4_price, e_fuel_price)
 
+    def set_domain_axes(ax, color_ind, npax_list, dist_list, title):
         #im = ax.imshow(color_ind, cmap=cmapa, vmin=0, vmax=len(labels) - 1)
         ax.set_xticks(
             np.linspace(0, len(color_ind), 6).astype(int)
@@ -45,7 +41,19 @@ def pritting_fuel():
             np.linspace(npax_list[0], npax_list[-1], num=7).astype(int)[::-1]
         )
         ax.set_title(title, fontsize=12)
-        return criterion
+
+    def plot_domain(ax, init_function, title):
+        # Maps and criteria are cached per set of inputs for all sessions
+        color_ind, npax_list, dist_list = app_cache.domain_maps([init_function.__name__], domain_inputs())[0]
+        set_domain_axes(ax, color_ind, npax_list, dist_list, title)
+        return app_cache.domain_setup(init_function.__name__, domain_inputs())[1]
+
+    def plot_domains(axes, init_functions, titles):
+        # All the maps are computed in one go so that their cells are spread over the same pool of workers
+        maps = app_cache.domain_maps([f.__name__ for f in init_functions], domain_inputs())
+        for ax, (color_ind, npax_list, dist_list), title in zip(axes, maps, titles):
+            set_domain_axes(ax, color_ind, npax_list, dist_list, title)
+        return [app_cache.domain_setup(f.__name__, domain_inputs())[1] for f in init_functions]
 
 
     st.sidebar.write("### Select the type of aircraft you want to show:")
@@ -115,12 +123,7 @@ def pritting_fuel():
             cmapa = LinearSegmentedColormap.from_list("mycmap", colors)
 
 
-            gam, design_mission, power_system, dist_window, npax_window, criterionCum = init_commuter(
-                max_fuel_factor, stdm_factor, lod_factor,
-                    battery_density, fuel_cell_power_density, lh2_tank_index,
-                    emotor_price, fuel_cell_price, lh2_tank_price, battery_capacity_price,
-                    battery_price, lh2_price, lch4_price, e_fuel_price
-            )
+            power_system, criterionCum = app_cache.domain_setup("init_commuter", domain_inputs())
             labels = [
                 power_system[key]["engine_type"] + " " + power_system[key]["energy_type"]
                 for key in power_system.keys()
@@ -211,12 +214,7 @@ def pritting_fuel():
             colors = ["green", "cyan", "blue", "orange", "brown"]
             cmapa = LinearSegmentedColormap.from_list("mycmap", colors)
 
-            gam, design_mission, power_system, dist_window, npax_window, criterionCum = init_commuter(
-                max_fuel_factor, stdm_factor, lod_factor,
-                    battery_density, fuel_cell_power_density, lh2_tank_index,
-                    emotor_price, fuel_cell_price, lh2_tank_price, battery_capacity_price,
-                    battery_price, lh2_price, lch4_price, e_fuel_price
-            )
+            power_system, criterionCum = app_cache.domain_setup("init_commuter", domain_inputs())
             labels = [
                 power_system[key]["engine_type"] + " " + power_system[key]["energy_type"]
                 for key in power_system.keys()
@@ -307,12 +305,7 @@ def pritting_fuel():
             colors = ["green", "cyan", "blue", "orange", "brown"]
             cmapa = LinearSegmentedColormap.from_list("mycmap", colors)
 
-            gam, design_mission, power_system, dist_window, npax_window, criterionCum = init_commuter(
-                max_fuel_factor, stdm_factor, lod_factor,
-                    battery_density, fuel_cell_power_density, lh2_tank_index,
-                    emotor_price, fuel_cell_price, lh2_tank_price, battery_capacity_price,
-                    battery_price, lh2_price, lch4_price, e_fuel_price
-            )
+            power_system, criterionCum = app_cache.domain_setup("init_commuter", domain_inputs())
             labels = [
                 power_system[key]["engine_type"] + " " + power_system[key]["energy_type"]
                 for key in power_system.keys()
@@ -403,12 +396,7 @@ def pritting_fuel():
             colors = ["green", "cyan", "blue", "orange", "brown"]
             cmapa = LinearSegmentedColormap.from_list("mycmap", colors)
 
-            gam, design_mission, power_system, dist_window, npax_window, criterionCum = init_commuter(
-                max_fuel_factor, stdm_factor, lod_factor,
-                    battery_density, fuel_cell_power_density, lh2_tank_index,
-                    emotor_price, fuel_cell_price, lh2_tank_price, battery_capacity_price,
-                    battery_price, lh2_price, lch4_price, e_fuel_price
-            )
+            power_system, criterionCum = app_cache.domain_setup("init_commuter", domain_inputs())
             labels = [
                 power_system[key]["engine_type"] + " " + power_system[key]["energy_type"]
                 for key in power_system.keys()
@@ -499,12 +487,7 @@ def pritting_fuel():
             colors = ["green", "cyan", "blue", "orange", "brown"]
             cmapa = LinearSegmentedColormap.from_list("mycmap", colors)
 
-            gam, design_mission, power_system, dist_window, npax_window, criterionCum = init_commuter(
-                max_fuel_factor, stdm_factor, lod_factor,
-                    battery_density, fuel_cell_power_density, lh2_tank_index,
-                    emotor_price, fuel_cell_price, lh2_tank_price, battery_capacity_price,
-                    battery_price, lh2_price, lch4_price, e_fuel_price
-            )
+            power_system, criterionCum = app_cache.domain_setup("init_commuter", domain_inputs())
             labels = [
                 power_system[key]["engine_type"] + " " + power_system[key]["energy_type"]
                 for key in power_system.keys()
@@ -513,10 +496,7 @@ def pritting_fuel():
 
             titles = ["Commuter", "Regional", "Short-medium", "Long range"]
             init_functions = [init_commuter, init_regional, init_short, init_long]
-            criteria = []
-
-            for i, (init_func, title) in enumerate(zip(init_functions, titles)):
-                criteria.append(plot_domain(ax[i // 2, i % 2], init_func, title))
+            criteria = plot_domains(ax.flat, init_functions, titles)
 
             # Colors
             pcolors = cmapa(np.linspace(0.0, 1.0, len(labels)))